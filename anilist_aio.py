@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Asyncio front-end for the AniList client.
+
+Lookups run on worker threads through the shared, pooled AniListClient, so
+every coroutine draws from the same global rate limiter while a semaphore
+bounds how many requests are in flight at once.
+"""
+
+import asyncio
+import anilist_api
+
+DEFAULT_CONCURRENCY = 4  # Lookups allowed in flight at the same time
+
+class AsyncAniListClient:
+    """
+    Async variant of AniListClient with bounded concurrency.
+    """
+
+    def __init__(self, client=None, concurrency=DEFAULT_CONCURRENCY):
+        self.client = client or anilist_api.get_default_client()
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def _run(self, func, *args):
+        async with self._semaphore:
+            return await asyncio.to_thread(func, *args)
+
+    async def search_anime(self, title, force_refresh=False):
+        """
+        Search for an anime by title on AniList, with caching.
+        """
+        return await self._run(self.client.search_anime, title, force_refresh)
+
+    async def search_anime_batch(self, titles, force_refresh=False):
+        """
+        Search for many titles at once, sending the aliased batches concurrently.
+        """
+        titles = list(dict.fromkeys(titles))
+        size = anilist_api.SEARCH_BATCH_SIZE
+        chunks = [titles[i:i + size] for i in range(0, len(titles), size)]
+        results = {}
+        for chunk_results in await asyncio.gather(*(self._run(self.client.search_anime_batch, chunk, force_refresh) for chunk in chunks)):
+            results.update(chunk_results)
+        return results
+
+    async def get_anime_season_data(self, anime_id, force_refresh=False):
+        """
+        Fetch the seasonal data for an anime, with caching.
+        """
+        return await self._run(self.client.get_anime_season_data, anime_id, force_refresh)
+
+    async def get_many_season_data(self, anime_ids, force_refresh=False):
+        """
+        Fetch the seasonal data for several anime concurrently.
+
+        Returns a dict mapping each anime id to its season list.
+        """
+        anime_ids = list(dict.fromkeys(anime_ids))
+        seasons = await asyncio.gather(*(self.get_anime_season_data(anime_id, force_refresh) for anime_id in anime_ids))
+        return dict(zip(anime_ids, seasons))
@@ -2,28 +2,170 @@
 # -*- coding: utf-8 -*-
 
 import requests
+import threading
+import concurrent.futures
 import time
 import logging
 import cache
+import config
 
 API_URL = 'https://graphql.anilist.co'
-RATE_LIMIT_DELAY = 0.7  # ~85 requests per minute, safely under the 90 limit
+RATE_LIMIT_PER_MINUTE = 85  # Safely under the 90 limit until the server tells us otherwise
+MAX_RETRIES = 3  # Retries for HTTP 429 responses
 TIMEOUT = 10  # Timeout for HTTP requests in seconds
+POOL_SIZE = 4  # Keep-alive connections kept open to the API
+SEARCH_BATCH_SIZE = 10  # Titles packed into a single aliased GraphQL document
+MEDIA_BATCH_SIZE = 10  # Media nodes packed into a single aliased GraphQL document
+SEASON_RELATIONS = ('SEQUEL', 'PREQUEL')
+SEASON_FORMATS = ('TV', 'OVA', 'ONA')
 
-def search_anime(title, force_refresh=False):
+def _header_number(headers, name):
     """
-    Search for an anime by title on AniList, with caching.
+    Read a numeric header, returning None if it is missing or malformed.
     """
-    cache_key = cache.get_cache_key('search', title)
-    if not force_refresh:
-        cached_data = cache.get_cached_data(cache_key)
-        if cached_data:
-            return cached_data
+    try:
+        value = headers.get(name)
+        return float(value) if isinstance(value, (str, int, float)) else None
+    except (AttributeError, ValueError):
+        return None
 
-    query = '''
-    query ($search: String) {
-        Page(page: 1, perPage: 10) {
-            media(search: $search, type: ANIME, sort: POPULARITY_DESC) {
+class RateLimiter:
+    """
+    Token bucket shared by every AniList request.
+
+    Tokens are only taken when a request is about to be sent, so cache hits
+    cost nothing. The bucket is kept in sync with the X-RateLimit-* and
+    Retry-After headers returned by the API.
+    """
+
+    def __init__(self, per_minute=RATE_LIMIT_PER_MINUTE):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _wait_time(self):
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def wait_time(self):
+        """
+        Return how many seconds until a request may be sent.
+        """
+        with self._lock:
+            return self._wait_time()
+
+    def acquire(self):
+        """
+        Block until a token is available, then consume it.
+
+        The lock is released while waiting, so header updates from other
+        threads can extend the wait; it is re-checked whenever they do.
+        """
+        with self._lock:
+            while True:
+                wait = self._wait_time()
+                if wait <= 0:
+                    self.tokens -= 1
+                    return
+                self._lock.wait(wait)
+
+    def block_for(self, seconds):
+        """
+        Hold back all requests for the given number of seconds.
+        """
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self._lock.notify_all()
+
+    def update(self, headers):
+        """
+        Synchronise the bucket with the rate-limit headers of a response.
+        """
+        limit = _header_number(headers, 'X-RateLimit-Limit')
+        remaining = _header_number(headers, 'X-RateLimit-Remaining')
+        reset = _header_number(headers, 'X-RateLimit-Reset')
+        retry_after = _header_number(headers, 'Retry-After')
+
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if limit:
+                self.capacity = limit
+                self.rate = limit / 60.0
+            if remaining is not None:
+                self.tokens = min(self.tokens, remaining)
+            if retry_after is not None:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+            elif remaining is not None and remaining < 1 and reset is not None:
+                # X-RateLimit-Reset is a unix timestamp
+                self.blocked_until = max(self.blocked_until, now + max(0.0, reset - time.time()))
+            self._lock.notify_all()
+
+rate_limiter = RateLimiter()
+
+class SingleFlight:
+    """
+    Collapse concurrent lookups of the same key into one request.
+
+    The first caller to claim a key becomes its leader and must release it
+    with the result; everyone else waits on the leader's future.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def claim(self, key):
+        """
+        Claim a key, returning its future and whether the caller leads it.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = concurrent.futures.Future()
+            self._calls[key] = future
+            return future, True
+
+    def release(self, key, result=None, error=None):
+        """
+        Publish the leader's result (or error) to all waiters.
+        """
+        with self._lock:
+            future = self._calls.pop(key)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, func, *args):
+        """
+        Run func once for all concurrent callers with the same key.
+        """
+        future, leader = self.claim(key)
+        if not leader:
+            return future.result()
+        try:
+            result = func(*args)
+        except BaseException as e:
+            self.release(key, error=e)
+            raise
+        self.release(key, result)
+        return result
+
+SEARCH_MEDIA_FIELDS = '''
                 id
                 title {
                     romaji
@@ -31,52 +173,27 @@ def search_anime(title, force_refresh=False):
                     native
                 }
                 format
+                status
                 episodes
                 synonyms
-            }
+'''
+
+SEARCH_QUERY = '''
+    query ($search: String) {
+        Page(page: 1, perPage: 10) {
+            media(search: $search, type: ANIME, sort: POPULARITY_DESC) {%s}
         }
     }
-    '''
-    variables = {'search': title}
-
-    try:
-        response = requests.post(API_URL, json={'query': query, 'variables': variables}, timeout=TIMEOUT)
-        response.raise_for_status()
-        data = response.json()['data']['Page']['media']
-        cache.save_to_cache(cache_key, data)
-        time.sleep(RATE_LIMIT_DELAY)
-        return data
-    except requests.exceptions.RequestException as e:
-        logging.error(f"An error occurred while communicating with the AniList API: {e}")
-        return None
-    except (KeyError, TypeError):
-        logging.error("Unexpected response format from AniList API during search.")
-        return None
+    ''' % SEARCH_MEDIA_FIELDS
 
-def get_anime_season_data(anime_id, force_refresh=False, fetched_ids=None):
-    """
-    Recursively fetch the seasonal data for an anime, with caching.
-    """
-    cache_key = cache.get_cache_key('season', str(anime_id))
-    if not force_refresh:
-        cached_data = cache.get_cached_data(cache_key)
-        if cached_data:
-            return cached_data
-
-    if fetched_ids is None:
-        fetched_ids = set()
-
-    if anime_id in fetched_ids:
-        return []
-
-    query = '''
-    query ($id: Int) {
-      Media(id: $id, type: ANIME) {
+MEDIA_FIELDS = '''
         id
         title {
           romaji
           english
         }
+        format
+        status
         episodes
         relations {
           edges {
@@ -84,41 +201,561 @@ def get_anime_season_data(anime_id, force_refresh=False, fetched_ids=None):
             node {
               id
               format
-              episodes
-              title {
-                romaji
-                english
-              }
             }
           }
         }
-      }
+'''
+
+def build_batch_search_query(count):
+    """
+    Build a GraphQL document with one aliased Page block per title.
+    """
+    variables = ', '.join(f"$s{i}: String" for i in range(count))
+    blocks = ''.join(
+        f'''
+        s{i}: Page(page: 1, perPage: 10) {{
+            media(search: $s{i}, type: ANIME, sort: POPULARITY_DESC) {{{SEARCH_MEDIA_FIELDS}}}
+        }}'''
+        for i in range(count)
+    )
+    return f"query ({variables}) {{{blocks}\n    }}"
+
+def build_media_query(count):
+    """
+    Build a GraphQL document with one aliased Media block per id.
+    """
+    variables = ', '.join(f"$m{i}: Int" for i in range(count))
+    blocks = ''.join(
+        f'''
+      m{i}: Media(id: $m{i}, type: ANIME) {{{MEDIA_FIELDS}      }}'''
+        for i in range(count)
+    )
+    return f"query ({variables}) {{{blocks}\n    }}"
+
+def _media_node(media):
+    """
+    Reduce a Media response to the fields needed to walk a franchise.
+    """
+    return {
+        'id': media['id'],
+        'title': media['title']['romaji'] or media['title']['english'],
+        'format': media['format'],
+        'status': media.get('status'),
+        'episodes': media['episodes'],
+        'relations': [
+            {'id': edge['node']['id'], 'relationType': edge['relationType'], 'format': edge['node']['format']}
+            for edge in media['relations']['edges']
+        ],
     }
-    '''
 
-    variables = {'id': anime_id}
-    try:
-        response = requests.post(API_URL, json={'query': query, 'variables': variables}, timeout=TIMEOUT)
-        response.raise_for_status()
-        data = response.json()['data']['Media']
-        fetched_ids.add(anime_id)
-        time.sleep(RATE_LIMIT_DELAY)
-
-        seasons = [{'id': data['id'], 'title': data['title']['romaji'] or data['title']['english'], 'episodes': data['episodes']}]
-
-        for edge in data['relations']['edges']:
-            relation_type = edge['relationType']
-            node = edge['node']
-
-            if relation_type in ['SEQUEL', 'PREQUEL'] and node['format'] in ['TV', 'OVA', 'ONA']:
-                seasons.extend(get_anime_season_data(node['id'], force_refresh, fetched_ids))
-
-        cache.save_to_cache(cache_key, seasons)
-        return seasons
-
-    except requests.exceptions.RequestException as e:
-        logging.error(f"An error occurred while fetching season data: {e}")
-        return []
-    except (KeyError, TypeError):
-        logging.error("Unexpected response format from AniList API during season data fetch.")
-        return []
+def _season_neighbours(node):
+    """
+    Get the ids of the sequels and prequels of a node that count as seasons.
+    """
+    return [
+        relation['id'] for relation in node['relations']
+        if relation['relationType'] in SEASON_RELATIONS and relation['format'] in SEASON_FORMATS
+    ]
+
+def season_list_from_graph(graph, anime_id):
+    """
+    Compute the season list for an anime from its franchise graph.
+
+    Seasons are listed breadth-first from the given entry point.
+    """
+    seasons = []
+    seen = {anime_id}
+    queue = [anime_id]
+    for media_id in queue:
+        node = graph.get(str(media_id))
+        if node is None:
+            continue
+        seasons.append({'id': node['id'], 'title': node['title'], 'episodes': node['episodes']})
+        for neighbour in _season_neighbours(node):
+            if neighbour not in seen:
+                seen.add(neighbour)
+                queue.append(neighbour)
+    return seasons
+
+class Revalidator:
+    """
+    Refreshes expired cache entries on a background worker thread.
+
+    Used for stale-while-revalidate: callers get the expired entry right away
+    while the refresh goes through the normal, rate-limited request path.
+    """
+
+    def __init__(self, workers=1):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='anilist-revalidate')
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._futures = []
+
+    def claim(self, keys):
+        """
+        Mark keys as being refreshed, returning those that weren't already.
+        """
+        with self._lock:
+            new_keys = [key for key in keys if key not in self._pending]
+            self._pending.update(new_keys)
+            return new_keys
+
+    def submit(self, keys, func, *args):
+        """
+        Run a refresh for previously claimed keys in the background.
+        """
+        def refresh():
+            try:
+                func(*args)
+            except Exception as e:
+                logging.warning(f"Background cache refresh failed: {e}")
+            finally:
+                with self._lock:
+                    self._pending.difference_update(keys)
+
+        with self._lock:
+            self._futures.append(self._executor.submit(refresh))
+
+    def wait(self):
+        """
+        Block until all submitted refreshes have finished.
+        """
+        with self._lock:
+            futures, self._futures = self._futures, []
+        concurrent.futures.wait(futures)
+
+def _save_search_results(cache_key, results):
+    """
+    Cache search results; titles with no matches get the shorter negative TTL.
+    """
+    if results:
+        cache.save_to_cache(cache_key, results)
+    else:
+        cache.save_to_cache(cache_key, results, cache.get_negative_cache_duration())
+
+class AniListClient:
+    """
+    AniList GraphQL client that reuses one keep-alive HTTP session.
+
+    All clients share the module-level rate limiter by default so the API
+    budget is respected no matter how many clients are in use. In offline
+    mode lookups are served from the cache only, ignoring TTLs, and no
+    request is ever sent.
+    """
+
+    def __init__(self, api_url=API_URL, timeout=TIMEOUT, pool_size=POOL_SIZE, limiter=None, stale_while_revalidate=False, offline=False):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.rate_limiter = limiter or rate_limiter
+        self.stale_while_revalidate = stale_while_revalidate
+        self.offline = offline
+        self._flights = SingleFlight()
+        self._revalidator = Revalidator()
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+            'Content-Type': 'application/json',
+        })
+
+    def close(self):
+        """
+        Close the underlying HTTP session and its pooled connections.
+        """
+        self.session.close()
+
+    def wait_for_revalidation(self):
+        """
+        Wait for background refreshes of stale cache entries to finish.
+        """
+        self._revalidator.wait()
+
+    def _get_stale(self, cache_key, refresh, *args):
+        """
+        Return an expired cache entry and schedule its refresh.
+
+        Only applies in stale-while-revalidate mode; returns None otherwise
+        or if nothing is cached at all.
+        """
+        if not self.stale_while_revalidate:
+            return None
+
+        payload, expired = cache.get_cached_entry(cache_key)
+        if payload is None or not expired:
+            return None
+        if self._revalidator.claim([cache_key]):
+            logging.info(f"Serving stale cache entry '{cache_key}' while it is refreshed.")
+            self._revalidator.submit([cache_key], refresh, *args)
+        return payload
+
+    def post_query(self, query, variables):
+        """
+        Send a GraphQL query to AniList under the shared rate limiter.
+
+        HTTP 429 responses are retried up to MAX_RETRIES times, waiting for
+        Retry-After (or an exponential backoff) in between. Returns None
+        without sending anything in offline mode.
+        """
+        if self.offline:
+            logging.warning("Offline mode is enabled; not sending AniList query.")
+            return None
+
+        for attempt in range(MAX_RETRIES + 1):
+            self.rate_limiter.acquire()
+            response = self.session.post(self.api_url, json={'query': query, 'variables': variables}, timeout=self.timeout)
+            self.rate_limiter.update(response.headers)
+
+            if response.status_code == 429 and attempt < MAX_RETRIES:
+                if _header_number(response.headers, 'Retry-After') is None:
+                    self.rate_limiter.block_for(2 ** attempt)
+                logging.warning(f"AniList rate limit reached, retrying ({attempt + 1}/{MAX_RETRIES})...")
+                continue
+
+            response.raise_for_status()
+            return response.json()
+
+    def search_anime(self, title, force_refresh=False):
+        """
+        Search for an anime by title on AniList, with caching.
+
+        The cache key is built from the normalized title, so spelling variants
+        that differ only in case, punctuation or spacing share one cache entry
+        and request. The title itself is sent as the search text.
+        """
+        normalized = cache.normalize_title(title)
+        cache_key = cache.get_cache_key('search', normalized)
+        if self.offline:
+            return cache.get_cached_entry(cache_key)[0]
+        if not force_refresh:
+            cached_data = cache.get_cached_data(cache_key)
+            if cached_data is None:
+                cached_data = self._get_stale(cache_key, self.search_anime, title, True)
+            if cached_data is not None:
+                return cached_data
+
+        return self._flights.do(('search', normalized), self._fetch_search, title.strip(), cache_key)
+
+    def _fetch_search(self, title, cache_key):
+        variables = {'search': title}
+
+        with cache.FetchLock(cache_key) as lock:
+            # Another process may have fetched it while we waited for the lock
+            if lock.waited:
+                cached_data = cache.get_cached_data(cache_key)
+                if cached_data is not None:
+                    return cached_data
+
+            try:
+                data = self.post_query(SEARCH_QUERY, variables)['data']['Page']['media']
+                _save_search_results(cache_key, data)
+                return data
+            except requests.exceptions.RequestException as e:
+                logging.error(f"An error occurred while communicating with the AniList API: {e}")
+                return None
+            except (KeyError, TypeError):
+                logging.error("Unexpected response format from AniList API during search.")
+                return None
+
+    def _fetch_search_chunks(self, titles, results, search_texts=None):
+        """
+        Search for normalized titles SEARCH_BATCH_SIZE at a time, caching and
+        storing the results (None for failed lookups) in the given dict.
+
+        search_texts maps a normalized title to the text sent to AniList.
+        """
+        search_texts = search_texts or {}
+        for start in range(0, len(titles), SEARCH_BATCH_SIZE):
+            chunk = titles[start:start + SEARCH_BATCH_SIZE]
+            query = build_batch_search_query(len(chunk))
+            variables = {f"s{i}": search_texts.get(title, title) for i, title in enumerate(chunk)}
+
+            try:
+                data = self.post_query(query, variables)['data']
+                for i, title in enumerate(chunk):
+                    media = data[f"s{i}"]['media']
+                    _save_search_results(cache.get_cache_key('search', title), media)
+                    results[title] = media
+            except requests.exceptions.RequestException as e:
+                logging.error(f"An error occurred while communicating with the AniList API: {e}")
+            except (KeyError, TypeError):
+                logging.error("Unexpected response format from AniList API during batch search.")
+
+            for title in chunk:
+                results.setdefault(title, None)
+
+    def search_anime_batch(self, titles, force_refresh=False):
+        """
+        Search for many titles on AniList at once, with caching.
+
+        Cache keys are built from the normalized titles and variants of the
+        same title are looked up once, searching for the first variant given.
+        Returns a dict mapping each given title to its results (None if the
+        lookup failed).
+        """
+        groups = {}
+        for title in titles:
+            groups.setdefault(cache.normalize_title(title), []).append(title)
+
+        if self.offline:
+            normalized_results = {title: cache.get_cached_entry(cache.get_cache_key('search', title))[0] for title in groups}
+        else:
+            search_texts = {normalized: variants[0].strip() for normalized, variants in groups.items()}
+            normalized_results = self._search_normalized_batch(list(groups), force_refresh, search_texts)
+        return {title: normalized_results[normalized] for normalized, variants in groups.items() for title in variants}
+
+    def _search_normalized_batch(self, titles, force_refresh=False, search_texts=None):
+        """
+        Search for many normalized titles on AniList at once, with caching.
+
+        Cached titles are served locally (expired ones too, in
+        stale-while-revalidate mode, refreshed in the background); the rest
+        are packed SEARCH_BATCH_SIZE at a time into aliased queries. Titles
+        already being searched by another caller or process are awaited
+        instead of requested again. search_texts maps a title to the text
+        sent to AniList. Returns a dict mapping each title to its results
+        (None if the lookup failed).
+        """
+        search_texts = search_texts or {}
+        results = {}
+        pending = []
+        waiting = {}
+        stale = {}
+        for title in dict.fromkeys(titles):
+            if not force_refresh:
+                cache_key = cache.get_cache_key('search', title)
+                cached_data = cache.get_cached_data(cache_key)
+                if cached_data is not None:
+                    results[title] = cached_data
+                    continue
+                if self.stale_while_revalidate:
+                    cached_data, _ = cache.get_cached_entry(cache_key)
+                    if cached_data is not None:
+                        results[title] = cached_data
+                        stale[cache_key] = title
+                        continue
+            future, leader = self._flights.claim(('search', title))
+            if leader:
+                pending.append(title)
+            else:
+                waiting[title] = future
+
+        if stale:
+            keys = self._revalidator.claim(list(stale))
+            if keys:
+                logging.info(f"Serving {len(stale)} stale search result(s) while they are refreshed.")
+                self._revalidator.submit(keys, self.search_anime_batch, [search_texts.get(stale[key], stale[key]) for key in keys], True)
+
+        released = set()
+        try:
+            # Titles another process is already fetching are read from the
+            # cache once it is done, instead of being requested twice. Only
+            # the chunk about to be sent is locked.
+            deferred = []
+            for start in range(0, len(pending), SEARCH_BATCH_SIZE):
+                chunk = pending[start:start + SEARCH_BATCH_SIZE]
+                locks = {title: cache.FetchLock(cache.get_cache_key('search', title)) for title in chunk}
+                fetching = [title for title in chunk if locks[title].try_acquire()]
+                deferred.extend(title for title in chunk if title not in fetching)
+                try:
+                    self._fetch_search_chunks(fetching, results, search_texts)
+                finally:
+                    for lock in locks.values():
+                        lock.release()
+                for title in fetching:
+                    self._flights.release(('search', title), results[title])
+                    released.add(title)
+
+            for title in deferred:
+                cache.FetchLock(cache.get_cache_key('search', title)).wait()
+                cached_data = cache.get_cached_data(cache.get_cache_key('search', title))
+                if cached_data is not None:
+                    results[title] = cached_data
+            self._fetch_search_chunks([title for title in deferred if title not in results], results, search_texts)
+            for title in deferred:
+                self._flights.release(('search', title), results[title])
+                released.add(title)
+        finally:
+            # Never leave other callers waiting on a title we claimed
+            for title in pending:
+                if title not in released:
+                    self._flights.release(('search', title))
+
+        for title, future in waiting.items():
+            results[title] = future.result()
+
+        return results
+
+    def fetch_media_nodes(self, anime_ids):
+        """
+        Fetch the franchise nodes (relations, episodes, format) for several ids.
+
+        Ids are fetched MEDIA_BATCH_SIZE at a time in aliased queries; ids
+        already being fetched by another caller are awaited instead. Returns
+        a dict mapping each id that could be resolved to its node.
+        """
+        nodes = {}
+        pending = []
+        waiting = {}
+        for anime_id in anime_ids:
+            future, leader = self._flights.claim(('media', anime_id))
+            if leader:
+                pending.append(anime_id)
+            else:
+                waiting[anime_id] = future
+
+        released = set()
+        try:
+            for start in range(0, len(pending), MEDIA_BATCH_SIZE):
+                chunk = pending[start:start + MEDIA_BATCH_SIZE]
+                variables = {f"m{i}": anime_id for i, anime_id in enumerate(chunk)}
+
+                try:
+                    data = self.post_query(build_media_query(len(chunk)), variables)['data']
+                    for i, anime_id in enumerate(chunk):
+                        nodes[anime_id] = _media_node(data[f"m{i}"])
+                except requests.exceptions.RequestException as e:
+                    logging.error(f"An error occurred while fetching season data: {e}")
+                except (KeyError, TypeError):
+                    logging.error("Unexpected response format from AniList API during season data fetch.")
+
+                for anime_id in chunk:
+                    self._flights.release(('media', anime_id), nodes.get(anime_id))
+                    released.add(anime_id)
+        finally:
+            # Never leave other callers waiting on an id we claimed
+            for anime_id in pending:
+                if anime_id not in released:
+                    self._flights.release(('media', anime_id))
+
+        for anime_id, future in waiting.items():
+            node = future.result()
+            if node is not None:
+                nodes[anime_id] = node
+
+        return nodes
+
+    def get_anime_season_data(self, anime_id, force_refresh=False):
+        """
+        Fetch the seasonal data for an anime, with caching.
+
+        The franchise graph is loaded from the cache and only the nodes it is
+        missing are fetched, breadth-first, one request per frontier level.
+        The season list is then computed locally from the graph. In offline
+        mode only the cached graph is used, however old it is.
+        """
+        if self.offline:
+            return season_list_from_graph(cache.get_franchise_graph(anime_id, allow_stale=True) or {}, anime_id)
+
+        if not force_refresh and self.stale_while_revalidate and cache.get_franchise_graph(anime_id) is None:
+            graph = cache.get_franchise_graph(anime_id, allow_stale=True)
+            if graph is not None:
+                key = ('season', anime_id)
+                if self._revalidator.claim([key]):
+                    logging.info(f"Serving stale season data for {anime_id} while it is refreshed.")
+                    self._revalidator.submit([key], self.get_anime_season_data, anime_id, True)
+                return season_list_from_graph(graph, anime_id)
+
+        graph = {}
+        frontier = [anime_id]
+        seen = {anime_id}
+        fetched = False
+        complete = True
+        lock = None
+        try:
+            while frontier:
+                if not force_refresh:
+                    for media_id in frontier:
+                        if str(media_id) not in graph:
+                            graph.update(cache.get_franchise_graph(media_id) or {})
+
+                missing = [media_id for media_id in frontier if str(media_id) not in graph]
+                if missing and lock is None:
+                    # Only lock once a fetch is needed; if another process held
+                    # the lock, re-read the cache before fetching anything
+                    lock = cache.FetchLock(cache.get_cache_key('member', str(anime_id))).acquire()
+                    if lock.waited and not force_refresh:
+                        continue
+                if missing:
+                    nodes = self.fetch_media_nodes(missing)
+                    graph.update({str(media_id): node for media_id, node in nodes.items()})
+                    fetched = True
+
+                next_frontier = []
+                for media_id in frontier:
+                    node = graph.get(str(media_id))
+                    if node is None:
+                        complete = False
+                        continue
+                    for neighbour in _season_neighbours(node):
+                        if neighbour not in seen:
+                            seen.add(neighbour)
+                            next_frontier.append(neighbour)
+                frontier = next_frontier
+
+            # Don't cache a partial graph, so the missing nodes are retried next time
+            if fetched and complete:
+                cache.save_to_franchise_graph(graph)
+        finally:
+            if lock is not None:
+                lock.release()
+        return season_list_from_graph(graph, anime_id)
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_default_client():
+    """
+    Get the shared AniListClient, creating it from the configuration on first use.
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            conf = config.load_config()
+            client_conf = conf.get('anilist_client', {})
+            _default_client = AniListClient(
+                timeout=client_conf.get('timeout', TIMEOUT),
+                pool_size=client_conf.get('pool_size', POOL_SIZE),
+                stale_while_revalidate=conf.get('anilist_cache', {}).get('stale_while_revalidate', False),
+                offline=client_conf.get('offline', False),
+            )
+        return _default_client
+
+def set_offline(offline=True):
+    """
+    Switch the default client to (or out of) offline mode.
+    """
+    get_default_client().offline = offline
+
+def post_query(query, variables):
+    """
+    Send a GraphQL query to AniList using the default client.
+    """
+    return get_default_client().post_query(query, variables)
+
+def search_anime(title, force_refresh=False):
+    """
+    Search for an anime by title on AniList, with caching.
+    """
+    return get_default_client().search_anime(title, force_refresh)
+
+def search_anime_batch(titles, force_refresh=False):
+    """
+    Search for many titles on AniList at once, with caching.
+    """
+    return get_default_client().search_anime_batch(titles, force_refresh)
+
+def get_anime_season_data(anime_id, force_refresh=False):
+    """
+    Fetch the seasonal data for an anime, with caching.
+    """
+    return get_default_client().get_anime_season_data(anime_id, force_refresh)
+
+def wait_for_revalidation():
+    """
+    Wait for the default client's background cache refreshes to finish.
+    """
+    if _default_client is not None:
+        _default_client.wait_for_revalidation()
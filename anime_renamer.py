@@ -7,6 +7,7 @@ A script to rename anime video and subtitle files using AniList.co for metadata.
 """
 
 import argparse
+import asyncio
 from collections import defaultdict
 import logging
 import os
@@ -17,6 +18,8 @@ from fuzzywuzzy import process
 from tqdm import tqdm
 import xml.etree.ElementTree as ET
 import anilist_api
+import anilist_aio
+import cache
 import rclone_handler
 import config
 
@@ -38,22 +41,38 @@ def clean_filename(filename):
     filename = re.sub(r'([Ss]\d+)-([Ee]\d+)', r'\1\2', filename)
     return filename
 
-def find_files(directory, recursive, rclone_remote=None, rclone_config=None):
+def find_files(directory, recursive, rclone_remote=None, rclone_config=None, namespace=None):
     """
     Find video and subtitle files in the given directory and group them by folder.
+
+    Remote listings are streamed and filtered by extension on the remote,
+    and also seed the given RemoteNamespace. Nothing is returned for a
+    remote whose listing fails partway.
     """
     file_groups = defaultdict(lambda: {'videos': [], 'subtitles': []})
 
     if rclone_remote:
-        files = rclone_handler.rclone_lsjson(directory, rclone_config)
-        if files is None:
+        include = [f"*{ext}" for ext in VIDEO_EXTENSIONS + SUBTITLE_EXTENSIONS]
+        files = rclone_handler.iter_lsjson(directory, rclone_config, recursive=recursive, include=include)
+        if namespace is not None and directory != namespace.remote:
+            namespace = None
+        try:
+            for file in tqdm(files, desc="Scanning remote files"):
+                if namespace is not None:
+                    namespace.record(file, recursive)
+                dir_path = os.path.dirname(file['Path'])
+                if file['Path'].lower().endswith(VIDEO_EXTENSIONS):
+                    file_groups[dir_path]['videos'].append(file['Path'])
+                elif file['Path'].lower().endswith(SUBTITLE_EXTENSIONS):
+                    file_groups[dir_path]['subtitles'].append(file['Path'])
+            if namespace is not None and recursive:
+                namespace.mark_complete()
+        except rclone_handler.RcloneError as e:
+            # Don't process (or trust for collision checks) a partial listing
+            logging.error(f"{e}. Skipping '{directory}'.")
+            if namespace is not None:
+                namespace.clear()
             return {}
-        for file in tqdm(files, desc="Scanning remote files"):
-            dir_path = os.path.dirname(file['Path'])
-            if file['Path'].lower().endswith(VIDEO_EXTENSIONS):
-                file_groups[dir_path]['videos'].append(file['Path'])
-            elif file['Path'].lower().endswith(SUBTITLE_EXTENSIONS):
-                file_groups[dir_path]['subtitles'].append(file['Path'])
     else:
         if recursive:
             for root, _, files in os.walk(directory):
@@ -101,6 +120,24 @@ def choose_anime(results):
             print("\nOperation cancelled by user.")
             sys.exit(0)
 
+def match_anime(parsed_title, search_results, conf):
+    """
+    Pick an AniList result for a parsed title without asking the user.
+
+    Returns the matched anime (None if the match is ambiguous) and the fuzzy
+    match score (None if there was nothing to compare).
+    """
+    if not search_results:
+        return None, None
+    if len(search_results) == 1:
+        return search_results[0], None
+
+    titles = { (anime['title'].get('romaji') or anime['title'].get('english') or anime['title'].get('native')): anime for anime in search_results }
+    best_match = process.extractOne(parsed_title, titles.keys())
+    if best_match and best_match[1] >= conf['fuzzy_threshold']:
+        return titles[best_match[0]], best_match[1]
+    return None, best_match[1] if best_match else None
+
 def calculate_season_episode(absolute_episode, season_data):
     """
     Calculate the season and relative episode number from an absolute episode number.
@@ -152,23 +189,42 @@ def get_unique_filepath(filepath):
             return new_filepath
         version += 1
 
-def get_unique_rclone_filepath(remote, filepath, rclone_config=None):
+def get_unique_rclone_filepath(remote, filepath, rclone_config=None, namespace=None):
     """
     Get a unique filepath on an rclone remote by appending a version number if the file already exists.
+
+    With a RemoteNamespace, existing and planned names are looked up in it
+    instead of listing the directory, waiting for any queued move away from
+    a name before deciding whether it is free. Returns None if the directory
+    couldn't be listed, as a free name can't be guaranteed then.
     """
     dir_path = os.path.dirname(filepath)
     remote_dir_path = f"{remote}:{dir_path}"
 
-    existing_files = rclone_handler.rclone_lsf(remote_dir_path, rclone_config)
-
-    if os.path.basename(filepath) not in existing_files:
+    if namespace is not None:
+        existing_files = namespace.names(dir_path)
+    else:
+        existing_files = rclone_handler.rclone_lsf(remote_dir_path, rclone_config)
+    if existing_files is None:
+        return None
+
+    def is_free(name):
+        nonlocal existing_files
+        # A name held by a file that is still being moved away is only free once the move succeeds
+        if namespace is not None and namespace.wait_for_move(os.path.join(dir_path, name)):
+            names = namespace.names(dir_path)
+            if names is not None:
+                existing_files = names
+        return name not in existing_files
+
+    if is_free(os.path.basename(filepath)):
         return filepath
 
     base, ext = os.path.splitext(filepath)
     version = 2
     while True:
         new_filename = f"{os.path.basename(base)}_v{version}{ext}"
-        if new_filename not in existing_files:
+        if is_free(new_filename):
             return os.path.join(dir_path, new_filename)
         version += 1
 
@@ -194,12 +250,52 @@ def create_nfo_file(nfo_path, anime_data, season, episode, has_video):
     tree.write(nfo_path, encoding='utf-8', xml_declaration=True)
 
 
-def process_folder(folder_path, files, anime_data, conf, dry_run, force_refresh, interactive, bundle_ova, export_nfo, verbose, rclone_remote=None, rclone_config=None):
+def enqueue_rclone_move(pool, source_path, dest_path, namespace=None):
+    """
+    Queue a remote move on the operation pool.
+
+    The namespace, if given, already holds the planned destination; the
+    source is dropped from it once the move succeeds, or the destination
+    released if it fails (see RemoteNamespace.track_move).
+    """
+    future = pool.move(source_path, dest_path)
+    if namespace is not None:
+        namespace.track_move(source_path, dest_path, future)
+    return future
+
+def wait_for_rclone_moves(moves):
+    """
+    Wait for a folder's queued (source_path, dest_path, future) moves and report failures.
+
+    Returns the number of successful moves.
+    """
+    if not moves:
+        return 0
+
+    failed = [(source, dest) for source, dest, future in moves if not future.result()]
+    for source, dest in failed:
+        print(f"  ! Failed to move '{source}' -> '{dest}'")
+    print(f"  Moved {len(moves) - len(failed)} of {len(moves)} file(s) on the remote.")
+    return len(moves) - len(failed)
+
+def process_folder(folder_path, files, anime_data, conf, dry_run, force_refresh, interactive, bundle_ova, export_nfo, verbose, rclone_remote=None, rclone_config=None, rclone_transfers=rclone_handler.DEFAULT_TRANSFERS, namespace=None, pool=None):
     """
     Process and rename all video and subtitle files in a single folder.
+
+    Remote renames are queued on an RcloneOperationPool and run while the
+    remaining files are parsed; the folder's results are reported once they
+    have all finished. Collisions are checked against the remote's
+    RemoteNamespace, which is listed on demand if none is given.
     """
     all_files = sorted(files['videos'] + files['subtitles'])
     processed_episodes = set()
+    rclone_moves = []
+    own_pool = None
+    if rclone_remote:
+        if namespace is None:
+            namespace = rclone_handler.RemoteNamespace(rclone_remote, rclone_config)
+        if pool is None:
+            pool = own_pool = rclone_handler.RcloneOperationPool(rclone_config, conf.get('rclone_remote_limits'), rclone_transfers)
 
     season_data = []
     if anime_data:
@@ -287,7 +383,11 @@ def process_folder(folder_path, files, anime_data, conf, dry_run, force_refresh,
 
             if should_rename:
                 if rclone_remote:
-                    unique_video_path = get_unique_rclone_filepath(rclone_remote, new_video_path_candidate, rclone_config)
+                    unique_video_path = get_unique_rclone_filepath(rclone_remote, new_video_path_candidate, rclone_config, namespace)
+                    if unique_video_path is None:
+                        logging.error(f"Could not list '{os.path.dirname(new_video_path_candidate)}' on the remote. Skipping '{original_filename}' to avoid overwriting a file.")
+                        continue
+                    namespace.add(unique_video_path)
                     new_video_path = f"{rclone_remote}:{unique_video_path}"
                 else:
                     new_video_path = get_unique_filepath(new_video_path_candidate)
@@ -297,9 +397,7 @@ def process_folder(folder_path, files, anime_data, conf, dry_run, force_refresh,
 
                 if not dry_run:
                     if rclone_remote:
-                        if not rclone_handler.rclone_moveto(original_video_path, new_video_path, rclone_config):
-                            if rclone_handler.rclone_copyto(original_video_path, new_video_path, rclone_config):
-                                rclone_handler.rclone_delete(original_video_path, rclone_config)
+                        rclone_moves.append((original_video_path, new_video_path, enqueue_rclone_move(pool, original_video_path, new_video_path, namespace)))
                     else:
                         try:
                             os.rename(original_video_path, new_video_path)
@@ -350,7 +448,11 @@ def process_folder(folder_path, files, anime_data, conf, dry_run, force_refresh,
 
                     if should_rename_sub:
                         if rclone_remote:
-                            unique_sub_path = get_unique_rclone_filepath(rclone_remote, new_sub_path_candidate, rclone_config)
+                            unique_sub_path = get_unique_rclone_filepath(rclone_remote, new_sub_path_candidate, rclone_config, namespace)
+                            if unique_sub_path is None:
+                                logging.error(f"Could not list '{os.path.dirname(new_sub_path_candidate)}' on the remote. Skipping '{os.path.basename(sub_path)}' to avoid overwriting a file.")
+                                continue
+                            namespace.add(unique_sub_path)
                             new_sub_path = f"{rclone_remote}:{unique_sub_path}"
                         else:
                             new_sub_path = get_unique_filepath(new_sub_path_candidate)
@@ -360,9 +462,7 @@ def process_folder(folder_path, files, anime_data, conf, dry_run, force_refresh,
 
                         if not dry_run:
                             if rclone_remote:
-                                if not rclone_handler.rclone_moveto(original_sub_path, new_sub_path, rclone_config):
-                                    if rclone_handler.rclone_copyto(original_sub_path, new_sub_path, rclone_config):
-                                        rclone_handler.rclone_delete(original_sub_path, rclone_config)
+                                rclone_moves.append((original_sub_path, new_sub_path, enqueue_rclone_move(pool, original_sub_path, new_sub_path, namespace)))
                             else:
                                 try:
                                     os.rename(original_sub_path, new_sub_path)
@@ -379,6 +479,129 @@ def process_folder(folder_path, files, anime_data, conf, dry_run, force_refresh,
                 continue
         processed_episodes.add((show_id, absolute_episode))
 
+    wait_for_rclone_moves(rclone_moves)
+    if own_pool is not None:
+        own_pool.close()
+
+def scan_directory(directory, args, namespace=None):
+    """
+    Find the files in a directory and parse a title for each folder.
+
+    Returns a list of (folder, files, parsed_title) tuples.
+    """
+    if args.rclone_remote:
+        logging.info(f"Processing rclone remote: {directory}")
+        file_groups = find_files(directory, args.recursive, rclone_remote=args.rclone_remote, rclone_config=args.rclone_config, namespace=namespace)
+    else:
+        if not os.path.isdir(directory):
+            print(f"Error: The specified path '{directory}' is not a valid directory.")
+            return []
+        logging.info(f"Starting anime renamer on directory: {directory}")
+        file_groups = find_files(directory, args.recursive)
+
+    if not file_groups:
+        print("No video or subtitle files found to process.")
+        return []
+
+    folders = []
+    for folder, files in file_groups.items():
+        sample_filename = os.path.basename(files['videos'][0] if files['videos'] else files['subtitles'][0])
+        parsed_title = anitopy.parse(sample_filename).get('anime_title')
+
+        if not parsed_title:
+            logging.warning(f"Could not parse a title from '{sample_filename}'. Skipping folder."); continue
+
+        folders.append((folder, files, parsed_title))
+    return folders
+
+async def resolve_metadata_async(directories, args, conf, include_candidates=False, namespace=None):
+    """
+    Scan directories and look up their AniList metadata concurrently.
+
+    Each directory's titles are searched, and the season chains of folders
+    that will be matched automatically are prefetched into the cache, while
+    the next directory is still being scanned. With include_candidates, the
+    season chains of every search result are prefetched for folders that
+    would need a manual choice.
+    """
+    concurrency = conf.get('anilist_client', {}).get('concurrency', anilist_aio.DEFAULT_CONCURRENCY)
+    client = anilist_aio.AsyncAniListClient(concurrency=concurrency)
+    folders = []
+    search_results = {}
+
+    async def lookup(entries):
+        results = await client.search_anime_batch([parsed_title for _, _, parsed_title in entries], args.force_refresh)
+        search_results.update(results)
+        anime_ids = set()
+        for _, _, parsed_title in entries:
+            candidates = results.get(parsed_title)
+            matched = match_anime(parsed_title, candidates, conf)[0]
+            if matched:
+                anime_ids.add(matched['id'])
+            elif include_candidates and candidates:
+                anime_ids.update(anime['id'] for anime in candidates)
+        await client.get_many_season_data(sorted(anime_ids), args.force_refresh)
+
+    lookups = []
+    for directory in directories:
+        entries = await asyncio.to_thread(scan_directory, directory, args, namespace)
+        folders.extend(entries)
+        lookups.append(asyncio.create_task(lookup(entries)))
+    await asyncio.gather(*lookups)
+
+    return folders, search_results
+
+def print_cache_stats():
+    """
+    Print a summary of the persistent cache.
+    """
+    stats = cache.get_cache_stats()
+    print(f"Cache entries: {stats['entries']} ({stats['size'] / 1024:.1f} KiB), {stats['expired']} expired")
+    for prefix, prefix_stats in sorted(stats['prefixes'].items()):
+        print(f"  {prefix}: {prefix_stats['entries']} entries ({prefix_stats['size'] / 1024:.1f} KiB)")
+    if stats['hits'] is None:
+        print("Recorded cache hits: not tracked by the file backend (set cache_backend: sqlite)")
+    else:
+        print(f"Recorded cache hits: {stats['hits']}")
+    print("Entry age distribution:")
+    for label, count in stats['ages'].items():
+        print(f"  {label}: {count}")
+
+def prewarm_cache(directories, args, conf):
+    """
+    Resolve the search results and season chains for a library into the cache.
+
+    Nothing is renamed; this only fills the cache so a later rename run
+    doesn't need the network.
+    """
+    folders, search_results = asyncio.run(resolve_metadata_async(directories, args, conf, include_candidates=True))
+    anilist_api.wait_for_revalidation()
+
+    titles = {parsed_title for _, _, parsed_title in folders}
+    found = sum(1 for title in titles if search_results.get(title))
+    failed = sum(1 for title in titles if search_results.get(title) is None)
+    print(f"Prewarmed the cache for {len(titles)} unique title(s) across {len(folders)} folder(s): "
+          f"{found} with results, {len(titles) - found - failed} without, {failed} failed.")
+
+def print_key_report(folders):
+    """
+    Compare the search cache keys produced by raw and normalized titles.
+
+    Shows how many lookups title normalization saves on the scanned library
+    and how many of each kind of key the cache already holds.
+    """
+    raw_titles = {parsed_title for _, _, parsed_title in folders}
+    normalized_titles = {cache.normalize_title(title) for title in raw_titles}
+
+    def cached(titles):
+        return sum(1 for title in titles if cache.get_cached_entry(cache.get_cache_key('search', title))[0] is not None)
+
+    print(f"Folders scanned: {len(folders)}")
+    print(f"Unique raw titles: {len(raw_titles)} ({cached(raw_titles)} cached)")
+    print(f"Unique normalized keys: {len(normalized_titles)} ({cached(normalized_titles)} cached)")
+    if raw_titles:
+        print(f"Lookups saved by normalization: {len(raw_titles) - len(normalized_titles)} ({1 - len(normalized_titles) / len(raw_titles):.0%})")
+
 def interactive_menu():
     """
     Display an interactive menu for the user to choose an action.
@@ -416,11 +639,59 @@ def main():
     parser.add_argument("--export-nfo", action="store_true", help="Export .nfo files with metadata.")
     parser.add_argument("--rclone-remote", help="The rclone remote to process (e.g., 'gdrive:/Anime').")
     parser.add_argument("--rclone-config", help="Path to the rclone.conf file.")
+    parser.add_argument("--rclone-transport", choices=['cli', 'rc'], help="How to run rclone operations: 'cli' starts one rclone process per operation, 'rc' drives one shared rclone rcd daemon (default: rclone_transport from config.yaml).")
+    parser.add_argument("--rclone-transfers", type=int, help="Number of remote renames to run at once (default: rclone_transfers from config.yaml).")
+    parser.add_argument("--offline", action="store_true", help="Never contact AniList; use cached metadata regardless of age and fall back to parsed filenames.")
+    parser.add_argument("--async-lookups", action="store_true", help="Overlap AniList lookups with directory scanning.")
+    parser.add_argument("--migrate-cache", action="store_true", help="Copy the one-file-per-key cache directory into the configured cache backend.")
+    parser.add_argument("--cache-stats", action="store_true", help="Show cache sizes, entry ages and (with the SQLite backend) hit counts, then exit.")
+    parser.add_argument("--cache-prune", action="store_true", help="Remove expired entries and enforce the cache size limits, then exit.")
+    parser.add_argument("--cache-export", metavar="FILE", help="Export the cache into a portable bundle file, then exit.")
+    parser.add_argument("--cache-import", metavar="FILE", help="Merge a cache bundle file into the cache, keeping the newest entries, then exit.")
+    parser.add_argument("--cache-prefix", action="append", help="Only export or import cache entries with this key prefix (search, franchise or member). Can be repeated.")
+    parser.add_argument("--prewarm", action="store_true", help="Fill the cache with search results and season chains for the given directories without renaming anything.")
+    parser.add_argument("--key-report", action="store_true", help="Report how many search cache keys title normalization saves for the given directories, then exit.")
     args = parser.parse_args()
 
     log_level = logging.INFO if args.verbose else logging.WARNING
     logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s')
 
+    if args.migrate_cache:
+        if conf.get('cache_backend', 'file') == 'file':
+            print("The configured cache backend is already the file backend; set cache_backend in config.yaml first.")
+            sys.exit(1)
+        migrated = cache.migrate_file_cache()
+        print(f"Migrated {migrated} cache entries from '{cache.get_cache_dir()}'.")
+        return
+
+    if args.cache_export or args.cache_import:
+        if args.cache_export:
+            count = cache.export_bundle(args.cache_export, args.cache_prefix)
+            action = f"Exported {count} cache entries to '{args.cache_export}'."
+        else:
+            count = cache.import_bundle(args.cache_import, args.cache_prefix)
+            action = f"Imported {count} cache entries from '{args.cache_import}'."
+        if count is None:
+            print("Cache bundle operation failed; see the log for details.")
+            sys.exit(1)
+        print(action)
+        return
+
+    # Offline mode can come from the flag or from anilist_client.offline in the config
+    offline = cache.is_offline(args.offline)
+    if offline:
+        anilist_api.set_offline()
+
+    if args.cache_prune:
+        result = cache.prune_cache(offline=offline)
+        print(f"Removed {result['expired']} expired and {result['evicted']} evicted cache entries.")
+    if args.cache_stats:
+        print_cache_stats()
+    if args.cache_prune or args.cache_stats:
+        return
+
+    cache.maybe_compact(offline=offline)
+
     if len(sys.argv) == 1:
         choice = interactive_menu()
         if choice == 1:
@@ -457,65 +728,87 @@ def main():
     elif args.rclone_remote:
         directories.append(args.rclone_remote)
 
-    for directory in directories:
-        if args.rclone_remote:
-            logging.info(f"Processing rclone remote: {directory}")
-            file_groups = find_files(directory, args.recursive, rclone_remote=args.rclone_remote, rclone_config=args.rclone_config)
-        else:
-            if not os.path.isdir(directory):
-                print(f"Error: The specified path '{directory}' is not a valid directory."); continue
-            logging.info(f"Starting anime renamer on directory: {directory}")
-            file_groups = find_files(directory, args.recursive)
-
-        if not file_groups:
-            print("No video or subtitle files found to process."); continue
-
-        for folder, files in file_groups.items():
-            logging.info(f"\nProcessing folder: {folder}")
-
-            sample_filename = os.path.basename(files['videos'][0] if files['videos'] else files['subtitles'][0])
-            parsed_title = anitopy.parse(sample_filename).get('anime_title')
-
-            if not parsed_title:
-                logging.warning(f"Could not parse a title from '{sample_filename}'. Skipping folder."); continue
-
-            logging.info(f"Searching AniList for '{parsed_title}'...")
-            search_results = anilist_api.search_anime(parsed_title, args.force_refresh)
-
-            selected_anime = None
-            if not search_results:
-                print(f"No results found for '{parsed_title}'. Proceeding with parsed filename.")
-            elif len(search_results) == 1:
-                selected_anime = search_results[0]
-                title = selected_anime['title'].get(conf['title_language']) or selected_anime['title'].get('romaji') or selected_anime['title'].get('english') or selected_anime['title'].get('native')
-                print(f"Automatically matched with the only AniList result: {title}")
-            else:
-                titles = { (anime['title'].get('romaji') or anime['title'].get('english') or anime['title'].get('native')): anime for anime in search_results }
-                best_match = process.extractOne(parsed_title, titles.keys())
-                if best_match and best_match[1] >= conf['fuzzy_threshold']:
-                    selected_anime = titles[best_match[0]]
-                    title = selected_anime['title'].get(conf['title_language']) or selected_anime['title'].get('romaji') or selected_anime['title'].get('english') or selected_anime['title'].get('native')
-                    print(f"Automatically matched with AniList title (score: {best_match[1]}): {title}")
-                else:
-                    logging.info(f"Fuzzy match score was too low ({best_match[1] if best_match else 'N/A'}). Asking for user input.")
-                    selected_anime = choose_anime(search_results)
+    transfers = args.rclone_transfers or conf.get('rclone_transfers', rclone_handler.DEFAULT_TRANSFERS)
+    namespace = None
+    pool = None
+    if args.rclone_remote:
+        transport = rclone_handler.set_transport(args.rclone_transport or conf.get('rclone_transport', 'cli'), args.rclone_config, transfers)
+        logging.info(f"Using the rclone '{transport}' transport.")
+        namespace = rclone_handler.RemoteNamespace(args.rclone_remote, args.rclone_config)
+        pool = rclone_handler.RcloneOperationPool(args.rclone_config, conf.get('rclone_remote_limits'), transfers)
+
+    if args.key_report:
+        print_key_report([entry for directory in directories for entry in scan_directory(directory, args)])
+        return
+
+    if args.prewarm:
+        if offline:
+            print("--prewarm needs network access and can't be used in offline mode.")
+            sys.exit(1)
+        prewarm_cache(directories, args, conf)
+        return
 
+    if args.async_lookups:
+        folders, all_search_results = asyncio.run(resolve_metadata_async(directories, args, conf, namespace=namespace))
+    else:
+        folders = []
+        for directory in directories:
+            folders.extend(scan_directory(directory, args, namespace))
+
+        # Resolve every folder's title up front so the lookups can be batched
+        logging.info(f"Searching AniList for {len(folders)} folder title(s)...")
+        all_search_results = anilist_api.search_anime_batch([parsed_title for _, _, parsed_title in folders], args.force_refresh)
+
+    missing_metadata = []
+    for folder, files, parsed_title in folders:
+        logging.info(f"\nProcessing folder: {folder}")
+        search_results = all_search_results.get(parsed_title)
+
+        selected_anime = None
+        if search_results is None and offline:
+            missing_metadata.append(folder)
+            print(f"No cached metadata for '{parsed_title}'. Proceeding with parsed filename.")
+        elif not search_results:
+            print(f"No results found for '{parsed_title}'. Proceeding with parsed filename.")
+        else:
+            selected_anime, score = match_anime(parsed_title, search_results, conf)
             if selected_anime:
                 title = selected_anime['title'].get(conf['title_language']) or selected_anime['title'].get('romaji') or selected_anime['title'].get('english') or selected_anime['title'].get('native')
-                print(f"Processing with selected AniList title: {title}")
-
-            if args.interactive and selected_anime:
-                try:
-                    choice = input("Proceed with this match? (y/n): ").lower()
-                    if choice != 'y':
-                        print("Skipping folder.")
-                        continue
-                except KeyboardInterrupt:
-                    print("\nOperation cancelled by user.")
-                    sys.exit(0)
+                if score is None:
+                    print(f"Automatically matched with the only AniList result: {title}")
+                else:
+                    print(f"Automatically matched with AniList title (score: {score}): {title}")
+            else:
+                logging.info(f"Fuzzy match score was too low ({score if score is not None else 'N/A'}). Asking for user input.")
+                selected_anime = choose_anime(search_results)
 
-            process_folder(folder, files, selected_anime, conf, args.dry_run, args.force_refresh, args.interactive, args.bundle_ova, args.export_nfo, args.verbose, rclone_remote=args.rclone_remote, rclone_config=args.rclone_config)
+        if selected_anime:
+            title = selected_anime['title'].get(conf['title_language']) or selected_anime['title'].get('romaji') or selected_anime['title'].get('english') or selected_anime['title'].get('native')
+            print(f"Processing with selected AniList title: {title}")
 
+        if args.interactive and selected_anime:
+            try:
+                choice = input("Proceed with this match? (y/n): ").lower()
+                if choice != 'y':
+                    print("Skipping folder.")
+                    continue
+            except KeyboardInterrupt:
+                print("\nOperation cancelled by user.")
+                sys.exit(0)
+
+        process_folder(folder, files, selected_anime, conf, args.dry_run, args.force_refresh, args.interactive, args.bundle_ova, args.export_nfo, args.verbose, rclone_remote=args.rclone_remote, rclone_config=args.rclone_config, rclone_transfers=transfers, namespace=namespace, pool=pool)
+
+    if offline and missing_metadata:
+        print(f"\n{len(missing_metadata)} folder(s) had no cached metadata and were renamed from parsed filenames:")
+        for folder in missing_metadata:
+            print(f"  {folder}")
+
+    if pool is not None:
+        pool.close()
+    rclone_handler.close_transport()
+    anilist_api.wait_for_revalidation()
+    stats = cache.get_memory_cache_stats()
+    logging.info(f"In-memory cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate).")
     print("\nRenaming process complete.")
 
 if __name__ == "__main__":
@@ -2,24 +2,144 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
+import gzip
 import json
+import lzma
 import time
+import zlib
 import hashlib
 import logging
+import sqlite3
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
 import config
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FETCH_LOCK_TIMEOUT = 60  # Seconds after which a fetch lock is considered abandoned
+TEMP_FILE_MAX_AGE = 60 * 60  # Seconds after which leftover temporary files are removed
+
+# Leading byte of compressed values; plain JSON always starts with '{', '[' or similar
+COMPRESSION_MARKERS = {'zlib': b'Z', 'lzma': b'X', 'msgpack': b'M'}
+DECODE_ERRORS = (ValueError, zlib.error, lzma.LZMAError)
+
 def get_cache_dir():
     """
     Get the cache directory from the configuration.
     """
     return config.load_config().get('cache_dir', '.anime_renamer_cache')
 
-def get_cache_duration():
+def get_cache_duration(prefix=None):
     """
     Get the cache duration (in seconds) from the configuration.
+
+    Keys with a prefix listed in anilist_cache.prefix_durations use that
+    duration instead of the default one.
+    """
+    conf = config.load_config().get('anilist_cache', {})
+    prefix_durations = conf.get('prefix_durations') or {}
+    if prefix in prefix_durations:
+        return prefix_durations[prefix] * 60 * 60
+    return conf.get('duration', 24) * 60 * 60
+
+def get_finished_cache_duration():
+    """
+    Get the cache duration (in seconds) for data about finished media.
     """
     conf = config.load_config()
-    return conf.get('anilist_cache', {}).get('duration', 24) * 60 * 60
+    return conf.get('anilist_cache', {}).get('finished_duration', 720) * 60 * 60
+
+def get_negative_cache_duration():
+    """
+    Get the cache duration (in seconds) for lookups that found nothing.
+    """
+    conf = config.load_config()
+    return conf.get('anilist_cache', {}).get('negative_duration', 12) * 60 * 60
+
+def get_memory_cache_size():
+    """
+    Get the maximum number of entries kept in the in-memory cache tier.
+    """
+    return config.load_config().get('anilist_cache', {}).get('memory_size', 1024)
+
+def get_cache_limits():
+    """
+    Get the size limits and eviction policy for the persistent cache.
+
+    A limit of 0 means unlimited. The policy is 'lru' or 'lfu'.
+    """
+    conf = config.load_config().get('anilist_cache', {})
+    return {
+        'max_entries': conf.get('max_entries', 0),
+        'max_size': conf.get('max_size_mb', 0) * 1024 * 1024,
+        'eviction_policy': conf.get('eviction_policy', 'lru'),
+        'compaction_interval': conf.get('compaction_interval', 24) * 60 * 60,
+    }
+
+def get_cache_compression():
+    """
+    Get the storage format for cache values: 'none', 'zlib', 'lzma' or 'msgpack'.
+
+    Falls back to zlib when msgpack is configured but not installed.
+    """
+    compression = config.load_config().get('cache_compression', 'none')
+    if compression == 'msgpack' and msgpack is None:
+        return 'zlib'
+    if compression not in COMPRESSION_MARKERS:
+        return 'none'
+    return compression
+
+def encode_value(value, compression=None):
+    """
+    Serialise a cache value to bytes in the configured storage format.
+    """
+    compression = compression or get_cache_compression()
+    if compression == 'msgpack':
+        return COMPRESSION_MARKERS['msgpack'] + msgpack.packb(value, use_bin_type=True)
+
+    raw = json.dumps(value, separators=(',', ':')).encode('utf-8')
+    if compression == 'zlib':
+        return COMPRESSION_MARKERS['zlib'] + zlib.compress(raw)
+    if compression == 'lzma':
+        return COMPRESSION_MARKERS['lzma'] + lzma.compress(raw)
+    return raw
+
+def decode_value(data):
+    """
+    Deserialise a cache value written in any of the supported storage formats.
+    """
+    if isinstance(data, str):
+        return json.loads(data)
+
+    marker, body = data[:1], data[1:]
+    if marker == COMPRESSION_MARKERS['zlib']:
+        return json.loads(zlib.decompress(body))
+    if marker == COMPRESSION_MARKERS['lzma']:
+        return json.loads(lzma.decompress(body))
+    if marker == COMPRESSION_MARKERS['msgpack']:
+        if msgpack is None:
+            raise ValueError("cache value is stored as msgpack, which is not installed")
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(data)
+
+def normalize_title(title):
+    """
+    Normalize a title for use as a search query and cache key.
+
+    Applies Unicode NFKC, case folding, and collapses punctuation and
+    whitespace, so "Shingeki.no.Kyojin" and "shingeki no kyojin " match.
+    Titles made only of symbols or punctuation are kept as they are
+    (stripped), so they don't all share one empty key.
+    """
+    normalized = unicodedata.normalize('NFKC', title).casefold()
+    normalized = re.sub(r'[\W_]+', ' ', normalized)
+    return ' '.join(normalized.split()) or title.strip()
 
 def get_cache_key(prefix, query):
     """
@@ -28,49 +148,943 @@ def get_cache_key(prefix, query):
     query_bytes = query.encode('utf-8')
     return f"{prefix}_{hashlib.md5(query_bytes).hexdigest()}.json"
 
-def get_cached_data(key):
+CACHE_KEY_PATTERN = re.compile(r'^[a-z]+_[0-9a-f]{32}\.json$')
+
+def is_valid_cache_key(key):
     """
-    Retrieve data from the cache if it exists and is not expired.
+    Check whether a key has the shape get_cache_key produces.
     """
-    cache_dir = get_cache_dir()
-    cache_duration = get_cache_duration()
+    return isinstance(key, str) and CACHE_KEY_PATTERN.match(key) is not None
 
-    if not os.path.exists(cache_dir):
-        return None
+def get_key_prefix(key):
+    """
+    Get the prefix a cache key was generated with.
+    """
+    return key.split('_', 1)[0]
+
+class FileCacheBackend:
+    """
+    Stores each cache entry as a file in the cache directory, as plain JSON
+    or in the configured compressed format.
+
+    Files are sharded into two levels of hex-prefix directories taken from
+    the key's hash (e.g. ab/cd/search_abcd....json), so no directory grows
+    unboundedly. Entries from the older flat layout are still found and are
+    moved into their shard when read.
+    """
+
+    tracks_hits = False
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+
+    def _dir(self):
+        return self.cache_dir or get_cache_dir()
+
+    def _flat_path(self, key):
+        # Keys become file names, so they must never point outside the cache directory
+        if not key or key in (os.curdir, os.pardir) or os.path.basename(key) != key or (os.path.altsep and os.path.altsep in key):
+            raise ValueError(f"Invalid cache key '{key}'")
+        return os.path.join(self._dir(), key)
+
+    def _path(self, key):
+        digest = key.rsplit('_', 1)[-1]
+        if len(digest) < 4:
+            digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+        flat_path = self._flat_path(key)
+        return os.path.join(os.path.dirname(flat_path), digest[:2], digest[2:4], key)
+
+    def get_path(self, key):
+        """
+        Get the path of a stored entry, or where it will be stored.
+        """
+        path = self._path(key)
+        if not os.path.exists(path) and os.path.exists(self._flat_path(key)):
+            return self._flat_path(key)
+        return path
+
+    def read(self, key):
+        """
+        Read an entry ({'timestamp', 'payload'}), or None if it is missing or unreadable.
+        """
+        cache_file = self._path(key)
+        data = self._read_bytes(cache_file)
+        if data is None:
+            flat_file = self._flat_path(key)
+            data = self._read_bytes(flat_file)
+            if data is None:
+                return None
+            try:
+                os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+                os.replace(flat_file, cache_file)
+            except OSError:
+                cache_file = flat_file
+
+        try:
+            entry = decode_value(data)
+        except DECODE_ERRORS as e:
+            logging.warning(f"Could not read cache file '{cache_file}': {e}")
+            return None
+
+        # The entry's own timestamp is stored inside the file, so the
+        # modification time is free to record the last access for eviction
+        try:
+            os.utime(cache_file)
+        except OSError:
+            pass
+        return entry
+
+    def peek(self, key):
+        """
+        Read an entry like read(), without recording an access or moving the file.
+        """
+        cache_file = self._path(key)
+        if not os.path.exists(cache_file):
+            cache_file = self._flat_path(key)
+        return self._load(cache_file)
 
-    cache_file = os.path.join(cache_dir, key)
-    if os.path.exists(cache_file):
+    def _read_bytes(self, cache_file):
         try:
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if time.time() - data.get('timestamp', 0) < cache_duration:
-                    logging.info(f"Cache hit for key: {key}")
-                    return data['payload']
-                else:
-                    logging.info(f"Cache expired for key: {key}")
-        except (json.JSONDecodeError, KeyError) as e:
+            with open(cache_file, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except IOError as e:
             logging.warning(f"Could not read cache file '{cache_file}': {e}")
+            return None
+
+    def _load(self, cache_file):
+        data = self._read_bytes(cache_file)
+        if data is None:
+            return None
+        try:
+            return decode_value(data)
+        except DECODE_ERRORS as e:
+            logging.warning(f"Could not read cache file '{cache_file}': {e}")
+            return None
+
+    def write(self, key, entry):
+        """
+        Write an entry, replacing any previous one.
+        """
+        cache_file = self._path(key)
+        shard_dir = os.path.dirname(cache_file)
+
+        # Write to a temporary file and atomically move it into place, so
+        # concurrent readers never see a partially written entry
+        temp_path = None
+        try:
+            os.makedirs(shard_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=shard_dir, prefix=f".{key}.", suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(encode_value(entry))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, cache_file)
+        except (IOError, OSError) as e:
+            logging.error(f"Could not write to cache file '{cache_file}': {e}")
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+
+        # Drop any copy left in the old flat layout so it isn't listed twice
+        try:
+            os.remove(self._flat_path(key))
+        except OSError:
+            pass
+        return True
+
+    def _walk(self):
+        """
+        Yield (directory, filename) for every file in the flat and sharded layouts.
+        """
+        cache_dir = self._dir()
+        if not os.path.exists(cache_dir):
+            return
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            if len(name) == 2 and os.path.isdir(path):
+                for root, _, files in os.walk(path):
+                    for file in files:
+                        yield root, file
+            else:
+                yield cache_dir, name
+
+    def keys(self):
+        """
+        List the keys of all stored entries.
+        """
+        return [name for _, name in self._walk() if name.endswith('.json') and not name.startswith('.')]
+
+    def iter_entries(self):
+        """
+        Yield metadata (key, prefix, timestamp, expires_at, size, last_access, hits)
+        for every stored entry. Access counts are not tracked for files.
+        """
+        for root, key in self._walk():
+            if not key.endswith('.json') or key.startswith('.'):
+                continue
+            cache_file = os.path.join(root, key)
+            try:
+                stat = os.stat(cache_file)
+            except OSError:
+                continue
+            entry = self._load(cache_file)
+            timestamp = entry.get('timestamp', 0) if isinstance(entry, dict) else 0
+            duration = entry.get('duration', get_cache_duration(get_key_prefix(key))) if isinstance(entry, dict) else 0
+            yield {
+                'key': key,
+                'prefix': get_key_prefix(key),
+                'timestamp': timestamp,
+                'expires_at': timestamp + duration,
+                'size': stat.st_size,
+                'last_access': stat.st_mtime,
+                'hits': 0,
+            }
+
+    def delete(self, keys):
+        """
+        Delete the given entries.
+        """
+        for key in keys:
+            for path in (self._path(key), self._flat_path(key)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logging.warning(f"Could not delete cache file '{path}': {e}")
+
+    def remove_stale_temp_files(self):
+        """
+        Remove temporary files left behind by writers that crashed.
+        """
+        now = time.time()
+        for root, name in list(self._walk()):
+            if name.endswith('.tmp'):
+                path = os.path.join(root, name)
+                try:
+                    if now - os.path.getmtime(path) > TEMP_FILE_MAX_AGE:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+class SQLiteCacheBackend:
+    """
+    Stores cache entries in a single SQLite database in WAL mode.
+
+    Entries are keyed by their cache key (prefix + hash), with the prefix,
+    write time and any entry-specific duration indexed so expired entries
+    can be found without a full scan. Payloads are stored in the configured
+    storage format.
+    """
+
+    tracks_hits = True
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                ' key TEXT PRIMARY KEY,'
+                ' prefix TEXT NOT NULL,'
+                ' timestamp REAL NOT NULL,'
+                ' duration REAL,'
+                ' last_access REAL,'
+                ' hits INTEGER NOT NULL DEFAULT 0,'
+                ' payload TEXT NOT NULL)'
+            )
+            # Entries using their prefix's configured duration expire by (prefix, timestamp),
+            # entries with their own duration by timestamp + duration
+            self._conn.execute('CREATE INDEX IF NOT EXISTS cache_prefix_timestamp ON cache (prefix, timestamp)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS cache_explicit_expiry ON cache (timestamp + duration) WHERE duration IS NOT NULL')
+
+    def peek(self, key):
+        """
+        Read an entry like read(), without recording an access.
+        """
+        try:
+            with self._lock:
+                row = self._conn.execute('SELECT timestamp, duration, payload FROM cache WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"Could not read cache entry '{key}' from '{self.path}': {e}")
+            return None
+        return self._entry(key, row)
+
+    def _entry(self, key, row):
+        if row is None:
+            return None
+        try:
+            entry = {'timestamp': row[0], 'payload': decode_value(row[2])}
+            if row[1] is not None:
+                entry['duration'] = row[1]
+            return entry
+        except DECODE_ERRORS as e:
+            logging.warning(f"Could not decode cache entry '{key}': {e}")
+            return None
+
+    def read(self, key):
+        """
+        Read an entry ({'timestamp', 'payload'}), or None if it is missing or unreadable.
+        """
+        try:
+            with self._lock, self._conn:
+                row = self._conn.execute('SELECT timestamp, duration, payload FROM cache WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    self._conn.execute('UPDATE cache SET last_access = ?, hits = hits + 1 WHERE key = ?', (time.time(), key))
+        except sqlite3.Error as e:
+            logging.warning(f"Could not read cache entry '{key}' from '{self.path}': {e}")
+            return None
+        return self._entry(key, row)
+
+    def write(self, key, entry):
+        """
+        Write an entry, replacing any previous one.
+        """
+        timestamp = entry.get('timestamp', time.time())
+        row = (key, get_key_prefix(key), timestamp, entry.get('duration'), time.time(), encode_value(entry['payload']))
+        try:
+            with self._lock, self._conn:
+                self._conn.execute('INSERT OR REPLACE INTO cache (key, prefix, timestamp, duration, last_access, payload) VALUES (?, ?, ?, ?, ?, ?)', row)
+            return True
+        except sqlite3.Error as e:
+            logging.error(f"Could not write cache entry '{key}' to '{self.path}': {e}")
+            return False
+
+    def keys(self):
+        """
+        List the keys of all stored entries.
+        """
+        with self._lock:
+            return [row[0] for row in self._conn.execute('SELECT key FROM cache')]
+
+    def iter_entries(self):
+        """
+        Yield metadata (key, prefix, timestamp, expires_at, size, last_access, hits)
+        for every stored entry.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT key, prefix, timestamp, duration, length(payload), COALESCE(last_access, timestamp), hits FROM cache'
+            ).fetchall()
+        for key, prefix, timestamp, duration, size, last_access, hits in rows:
+            yield {
+                'key': key,
+                'prefix': prefix,
+                'timestamp': timestamp,
+                'expires_at': timestamp + (duration if duration is not None else get_cache_duration(prefix)),
+                'size': size,
+                'last_access': last_access,
+                'hits': hits,
+            }
+
+    def delete(self, keys):
+        """
+        Delete the given entries.
+        """
+        with self._lock, self._conn:
+            self._conn.executemany('DELETE FROM cache WHERE key = ?', ((key,) for key in keys))
+
+    def delete_expired(self, cutoff):
+        """
+        Delete the entries that expired at or before cutoff and return their keys.
+
+        Expiry follows each entry's own duration or the one currently
+        configured for its prefix, and both cases are looked up by index.
+        """
+        with self._lock, self._conn:
+            prefixes = [row[0] for row in self._conn.execute('SELECT DISTINCT prefix FROM cache')]
+            keys = []
+            for prefix in prefixes:
+                keys += [row[0] for row in self._conn.execute(
+                    'SELECT key FROM cache WHERE prefix = ? AND timestamp <= ? AND duration IS NULL',
+                    (prefix, cutoff - get_cache_duration(prefix)),
+                )]
+            keys += [row[0] for row in self._conn.execute(
+                'SELECT key FROM cache WHERE timestamp + duration <= ? AND duration IS NOT NULL', (cutoff,)
+            )]
+            self._conn.executemany('DELETE FROM cache WHERE key = ?', ((key,) for key in keys))
+        return keys
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_held_locks = set()
+_held_locks_lock = threading.Lock()
+_heartbeat_thread = None
+_heartbeat_wakeup = threading.Event()
+
+def _refresh_held_locks():
+    """
+    Keep the mtime of every held FetchLock fresh so other processes don't
+    mistake a long fetch for an abandoned lock.
+    """
+    global _heartbeat_thread
+    while True:
+        _heartbeat_wakeup.clear()
+        with _held_locks_lock:
+            locks = list(_held_locks)
+            if not locks:
+                _heartbeat_thread = None
+                return
+        for lock in locks:
+            lock.refresh()
+        # Woken early when a lock is added, as it may have a shorter timeout
+        _heartbeat_wakeup.wait(max(0.1, min(lock.timeout for lock in locks) / 4))
+
+class FetchLock:
+    """
+    Cross-process lock on a cache key, held while its data is fetched.
+
+    Lets several renamer processes share one cache directory without all of
+    them requesting the same data at once. The lock is an exclusively created
+    file, which works on any platform and on network filesystems. Its mtime
+    is refreshed while it is held, and locks not refreshed for
+    FETCH_LOCK_TIMEOUT are treated as abandoned. After entering, `waited`
+    tells whether another process held the lock, in which case the cache
+    should be checked again before fetching.
+    """
+
+    def __init__(self, key, timeout=FETCH_LOCK_TIMEOUT):
+        self.path = os.path.join(get_cache_dir(), '.locks', f"{key}.lock")
+        self.timeout = timeout
+        self.token = f"{os.getpid()}-{os.urandom(8).hex()}"
+        self.acquired = False
+        self.waited = False
+
+    def try_acquire(self):
+        """
+        Take the lock if it is free, returning whether the caller may fetch.
+        """
+        for _ in range(2):
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._is_abandoned():
+                    return False
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    pass
+                continue
+            except OSError as e:
+                # Locking is best effort; an unwritable cache just means no coordination
+                logging.warning(f"Could not create cache lock '{self.path}': {e}")
+                return True
+
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.token)
+            self.acquired = True
+            self._start_heartbeat()
+            return True
+        return False
+
+    def _start_heartbeat(self):
+        global _heartbeat_thread
+        with _held_locks_lock:
+            _held_locks.add(self)
+            _heartbeat_wakeup.set()
+            if _heartbeat_thread is None:
+                _heartbeat_thread = threading.Thread(target=_refresh_held_locks, name='cache-lock-heartbeat', daemon=True)
+                _heartbeat_thread.start()
+
+    def _is_abandoned(self):
+        try:
+            return time.time() - os.path.getmtime(self.path) > self.timeout
+        except OSError:
+            return True
+
+    def is_owned(self):
+        """
+        Check whether the lock file on disk is still the one this lock created.
+        """
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return f.read() == self.token
+        except OSError:
+            return False
+
+    def refresh(self):
+        """
+        Mark a held lock as still in use.
+        """
+        if self.acquired and self.is_owned():
+            try:
+                os.utime(self.path)
+            except OSError:
+                pass
+
+    def wait(self):
+        """
+        Wait until the current holder releases the lock or abandons it.
+        """
+        self.waited = True
+        while os.path.exists(self.path) and not self._is_abandoned():
+            time.sleep(0.1)
+
+    def release(self):
+        if self.acquired:
+            with _held_locks_lock:
+                _held_locks.discard(self)
+            # Another process may have taken over a lock it thought abandoned
+            if self.is_owned():
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    pass
+            self.acquired = False
+
+    def acquire(self):
+        """
+        Block until the lock is taken.
+        """
+        while not self.try_acquire():
+            self.wait()
+        return self
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+class MemoryCache:
+    """
+    Bounded LRU of recently used entries that sits in front of the backend.
+
+    Keeps hit/miss counters so the effectiveness of the tier can be reported.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get an entry and mark it as recently used, or None if it is not held.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        """
+        Store an entry, evicting the least recently used one if full.
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+_memory_cache = None
+_memory_cache_lock = threading.Lock()
+
+def get_memory_cache():
+    """
+    Get the process-wide in-memory cache tier, sized from the configuration.
+    """
+    global _memory_cache
+    with _memory_cache_lock:
+        if _memory_cache is None:
+            _memory_cache = MemoryCache(get_memory_cache_size())
+        return _memory_cache
+
+_file_backend = FileCacheBackend()
+_sqlite_backends = {}
+_sqlite_backends_lock = threading.Lock()
+
+def get_sqlite_path():
+    """
+    Get the path of the SQLite cache database from the configuration.
+    """
+    return config.load_config().get('cache_db') or os.path.join(get_cache_dir(), 'cache.sqlite3')
+
+def get_backend():
+    """
+    Get the cache backend selected by `cache_backend` in the configuration.
+    """
+    if config.load_config().get('cache_backend', 'file') != 'sqlite':
+        return _file_backend
+
+    path = get_sqlite_path()
+    with _sqlite_backends_lock:
+        if path not in _sqlite_backends:
+            _sqlite_backends[path] = SQLiteCacheBackend(path)
+        return _sqlite_backends[path]
+
+def get_cached_entry(key):
+    """
+    Retrieve data from the cache whether or not it has expired.
+
+    Returns a (payload, expired) tuple, with a None payload if nothing is
+    cached. Recently used entries are served from memory; everything else
+    is read from the configured backend.
+    """
+    memory = get_memory_cache()
+
+    data = memory.get(key)
+    if data is None:
+        data = get_backend().read(key)
+        if not isinstance(data, dict) or 'payload' not in data:
+            if data is not None:
+                logging.warning(f"Could not read cache entry '{key}': unexpected format")
+            return None, False
+        memory.put(key, data)
+
+    expired = time.time() - data.get('timestamp', 0) >= data.get('duration', get_cache_duration(get_key_prefix(key)))
+    return data['payload'], expired
+
+def get_cached_data(key):
+    """
+    Retrieve data from the cache if it exists and is not expired.
+
+    Returns None on a miss. Cached empty results (e.g. a search with no
+    matches) are returned as-is, so callers must compare against None.
+    """
+    payload, expired = get_cached_entry(key)
+    if payload is not None:
+        if not expired:
+            logging.info(f"Cache hit for key: {key}")
+            return payload
+        logging.info(f"Cache expired for key: {key}")
 
     logging.info(f"Cache miss for key: {key}")
     return None
 
-def save_to_cache(key, payload):
+def save_to_cache(key, payload, duration=None):
     """
     Save data to the cache.
-    """
-    cache_dir = get_cache_dir()
-
-    if not os.path.exists(cache_dir):
-        os.makedirs(cache_dir)
 
-    cache_file = os.path.join(cache_dir, key)
+    An explicit duration (in seconds) overrides the configured one for this entry.
+    """
     data = {
         'timestamp': time.time(),
         'payload': payload
     }
-    try:
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f)
+    if duration is not None:
+        data['duration'] = duration
+    get_memory_cache().put(key, data)
+    if get_backend().write(key, data):
         logging.info(f"Saved to cache with key: {key}")
-    except IOError as e:
-        logging.error(f"Could not write to cache file '{cache_file}': {e}")
+
+def get_memory_cache_stats():
+    """
+    Get the size and hit/miss counters of the in-memory cache tier.
+    """
+    memory = get_memory_cache()
+    lookups = memory.hits + memory.misses
+    return {
+        'entries': len(memory),
+        'max_entries': memory.max_entries,
+        'hits': memory.hits,
+        'misses': memory.misses,
+        'hit_rate': memory.hits / lookups if lookups else 0.0,
+    }
+
+def is_offline(offline=False):
+    """
+    Check whether offline mode is on, via the given flag or anilist_client.offline.
+    """
+    return offline or config.load_config().get('anilist_client', {}).get('offline', False)
+
+def get_expired_grace_period(offline=False):
+    """
+    Get how long (in seconds) an entry is kept after it expires.
+
+    Offline mode serves expired entries regardless of age, so they are
+    never dropped for being expired. In stale-while-revalidate mode they
+    are kept for anilist_cache.stale_grace hours so they can still be
+    served while refreshing.
+    """
+    if is_offline(offline):
+        return float('inf')
+    conf = config.load_config().get('anilist_cache', {})
+    if conf.get('stale_while_revalidate', False):
+        return conf.get('stale_grace', 168) * 60 * 60
+    return 0
+
+def prune_cache(backend=None, offline=False):
+    """
+    Drop expired entries, then evict entries until the cache fits its limits.
+
+    Entries within their grace period after expiry (see
+    get_expired_grace_period) are kept and only evicted for the limits.
+    Returns a dict with the number of expired and evicted entries.
+    """
+    backend = backend or get_backend()
+    limits = get_cache_limits()
+    now = time.time()
+    grace = get_expired_grace_period(offline)
+
+    if isinstance(backend, SQLiteCacheBackend):
+        expired = [] if grace == float('inf') else backend.delete_expired(now - grace)
+        live = list(backend.iter_entries())
+    else:
+        entries = list(backend.iter_entries())
+        expired = [entry['key'] for entry in entries if entry['expires_at'] + grace <= now]
+        live = [entry for entry in entries if entry['expires_at'] + grace > now]
+        if expired:
+            backend.delete(expired)
+
+    policy = limits['eviction_policy']
+    if policy == 'lfu' and not backend.tracks_hits:
+        logging.warning("The 'lfu' eviction policy needs hit counts, which the file backend doesn't track; evicting by LRU instead.")
+        policy = 'lru'
+    if policy == 'lfu':
+        live.sort(key=lambda entry: (entry['hits'], entry['last_access']))
+    else:
+        live.sort(key=lambda entry: entry['last_access'])
+
+    evicted = []
+    total_size = sum(entry['size'] for entry in live)
+    while live and ((limits['max_entries'] and len(live) > limits['max_entries']) or
+                    (limits['max_size'] and total_size > limits['max_size'])):
+        entry = live.pop(0)
+        total_size -= entry['size']
+        evicted.append(entry)
+
+    if isinstance(backend, FileCacheBackend):
+        backend.remove_stale_temp_files()
+
+    if evicted:
+        backend.delete([entry['key'] for entry in evicted])
+    memory = get_memory_cache()
+    for key in expired + [entry['key'] for entry in evicted]:
+        memory.discard(key)
+
+    _touch_compaction_marker()
+    logging.info(f"Cache pruned: {len(expired)} expired and {len(evicted)} evicted entries removed.")
+    return {'expired': len(expired), 'evicted': len(evicted)}
+
+def _compaction_marker():
+    return os.path.join(get_cache_dir(), '.last_compaction')
+
+def _touch_compaction_marker():
+    marker = _compaction_marker()
+    try:
+        os.makedirs(os.path.dirname(marker) or '.', exist_ok=True)
+        with open(marker, 'a', encoding='utf-8'):
+            pass
+        os.utime(marker)
+    except OSError as e:
+        logging.warning(f"Could not update cache compaction marker '{marker}': {e}")
+
+def maybe_compact(offline=False):
+    """
+    Run prune_cache if the last compaction is older than the configured interval.
+
+    Never runs in offline mode, where the cache can't be refilled. Returns
+    the prune result, or None if no compaction was due.
+    """
+    if is_offline(offline) or not os.path.exists(get_cache_dir()):
+        return None
+
+    interval = get_cache_limits()['compaction_interval']
+    try:
+        last_compaction = os.path.getmtime(_compaction_marker())
+    except OSError:
+        last_compaction = 0
+    if time.time() - last_compaction < interval:
+        return None
+    return prune_cache()
+
+AGE_BUCKETS = (
+    ('< 1 hour', 60 * 60),
+    ('< 1 day', 24 * 60 * 60),
+    ('< 1 week', 7 * 24 * 60 * 60),
+    ('< 30 days', 30 * 24 * 60 * 60),
+    ('older', float('inf')),
+)
+
+def get_cache_stats(backend=None):
+    """
+    Summarise the persistent cache: entry counts and sizes per prefix, expired
+    entries, recorded hits and the age distribution of entries.
+
+    Hits are None for backends that don't record them.
+    """
+    backend = backend or get_backend()
+    now = time.time()
+    stats = {
+        'entries': 0,
+        'size': 0,
+        'expired': 0,
+        'hits': 0 if backend.tracks_hits else None,
+        'prefixes': {},
+        'ages': {label: 0 for label, _ in AGE_BUCKETS},
+    }
+    for entry in backend.iter_entries():
+        stats['entries'] += 1
+        stats['size'] += entry['size']
+        if backend.tracks_hits:
+            stats['hits'] += entry['hits']
+        if entry['expires_at'] <= now:
+            stats['expired'] += 1
+
+        prefix = stats['prefixes'].setdefault(entry['prefix'], {'entries': 0, 'size': 0})
+        prefix['entries'] += 1
+        prefix['size'] += entry['size']
+
+        age = now - entry['timestamp']
+        label = next(label for label, limit in AGE_BUCKETS if age < limit)
+        stats['ages'][label] += 1
+    return stats
+
+def migrate_file_cache(source_dir=None, backend=None):
+    """
+    Copy every entry of a one-file-per-key cache directory into a backend.
+
+    Defaults to the configured cache directory and backend. Returns the
+    number of entries migrated.
+    """
+    source = FileCacheBackend(source_dir)
+    backend = backend or get_backend()
+
+    migrated = 0
+    for key in source.keys():
+        data = source.peek(key)
+        if isinstance(data, dict) and 'payload' in data and backend.write(key, data):
+            migrated += 1
+    return migrated
+
+BUNDLE_VERSION = 1
+
+def export_bundle(path, prefixes=None, backend=None):
+    """
+    Write cache entries into a single gzip-compressed JSON bundle file.
+
+    Only keys whose prefix is in prefixes are exported, if given. Returns
+    the number of exported entries, or None if the bundle couldn't be written.
+    """
+    backend = backend or get_backend()
+
+    entries = {}
+    for key in backend.keys():
+        if prefixes and get_key_prefix(key) not in prefixes:
+            continue
+        data = backend.peek(key)
+        if isinstance(data, dict) and 'payload' in data:
+            entries[key] = data
+
+    bundle = {'version': BUNDLE_VERSION, 'created': time.time(), 'entries': entries}
+    temp_path = None
+    try:
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(gzip.compress(json.dumps(bundle).encode('utf-8')))
+        os.replace(temp_path, path)
+    except (IOError, OSError) as e:
+        logging.error(f"Could not write cache bundle '{path}': {e}")
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+        return None
+    return len(entries)
+
+def import_bundle(path, prefixes=None, backend=None):
+    """
+    Merge the entries of a bundle file into the cache.
+
+    For keys present on both sides the entry with the newest timestamp
+    wins. Returns the number of imported entries, or None if the bundle
+    couldn't be read.
+    """
+    try:
+        with open(path, 'rb') as f:
+            bundle = json.loads(gzip.decompress(f.read()).decode('utf-8'))
+    except (IOError, OSError, EOFError, ValueError) as e:
+        logging.error(f"Could not read cache bundle '{path}': {e}")
+        return None
+
+    if not isinstance(bundle, dict) or bundle.get('version') != BUNDLE_VERSION or not isinstance(bundle.get('entries'), dict):
+        logging.error(f"Could not read cache bundle '{path}': unsupported format")
+        return None
+
+    backend = backend or get_backend()
+    memory = get_memory_cache()
+    imported = 0
+    for key, data in bundle['entries'].items():
+        if not is_valid_cache_key(key):
+            logging.warning(f"Skipping invalid cache key '{key}' in bundle '{path}'.")
+            continue
+        if prefixes and get_key_prefix(key) not in prefixes:
+            continue
+        if not isinstance(data, dict) or 'payload' not in data:
+            continue
+        current = backend.peek(key)
+        if isinstance(current, dict) and current.get('timestamp', 0) >= data.get('timestamp', 0):
+            continue
+        if backend.write(key, data):
+            memory.discard(key)
+            imported += 1
+    return imported
+
+def get_franchise_graph(media_id, allow_stale=False):
+    """
+    Retrieve the cached franchise graph that contains the given media id.
+
+    The graph maps each member's media id (as a string) to its node with
+    relations, episodes and format. With allow_stale, an expired graph is
+    returned too.
+    """
+    read = (lambda key: get_cached_entry(key)[0]) if allow_stale else get_cached_data
+
+    franchise_id = read(get_cache_key('member', str(media_id)))
+    if franchise_id is None:
+        return None
+
+    graph = read(get_cache_key('franchise', str(franchise_id)))
+    if graph and str(media_id) in graph:
+        return graph
+    return None
+
+FINISHED_STATUSES = ('FINISHED', 'CANCELLED')
+
+def save_to_franchise_graph(graph):
+    """
+    Save a franchise graph and index every member so any of them can find it.
+
+    Graphs whose members have all finished airing rarely change, so they
+    are kept for the longer finished duration.
+    """
+    duration = None
+    if all(node.get('status') in FINISHED_STATUSES for node in graph.values()):
+        duration = get_finished_cache_duration()
+
+    franchise_id = min(int(media_id) for media_id in graph)
+    save_to_cache(get_cache_key('franchise', str(franchise_id)), graph, duration)
+    for media_id in graph:
+        save_to_cache(get_cache_key('member', str(media_id)), franchise_id, duration)
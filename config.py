@@ -10,9 +10,31 @@ DEFAULT_CONFIG = {
     'rename_template': '{title} - S{season:02d}E{episode:02d} - Episode {episode:02d}',
     'fuzzy_threshold': 85,
     'cache_dir': '.anime_renamer_cache',
+    'cache_backend': 'file',  # 'file' or 'sqlite'
+    'cache_db': None,  # Defaults to cache.sqlite3 inside cache_dir
+    'cache_compression': 'none',  # 'none', 'zlib', 'lzma' or 'msgpack' (falls back to zlib if not installed)
+    'rclone_transport': 'cli',  # 'cli' (one rclone process per operation) or 'rc' (shared rclone rcd daemon)
+    'rclone_transfers': 4,  # Remote renames to run at once
+    'rclone_remote_limits': {},  # Per-remote overrides of rclone_transfers, e.g. {'gdrive': 2, 's3': 16}
     'anilist_cache': {
         'enabled': True,
-        'duration': 24
+        'duration': 24,
+        'negative_duration': 12,  # Hours to remember titles with no AniList results
+        'memory_size': 1024,
+        'stale_while_revalidate': False,  # Serve expired entries and refresh them in the background
+        'stale_grace': 168,  # Hours expired entries are kept for stale-while-revalidate before pruning
+        'max_entries': 0,  # 0 = unlimited
+        'max_size_mb': 0,  # 0 = unlimited
+        'eviction_policy': 'lru',  # 'lru' or 'lfu' (lfu needs cache_backend: sqlite)
+        'compaction_interval': 24,  # Hours between automatic removal of expired entries
+        'prefix_durations': {},  # Hours per key prefix, e.g. {'search': 72}
+        'finished_duration': 720  # Hours to keep franchise graphs whose shows have all finished airing
+    },
+    'anilist_client': {
+        'timeout': 10,
+        'pool_size': 4,
+        'concurrency': 4,
+        'offline': False
     }
 }
 
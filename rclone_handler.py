@@ -6,6 +6,24 @@ import json
 import logging
 import os
 import re
+import time
+import atexit
+import socket
+import secrets
+import tempfile
+import threading
+import concurrent.futures
+import requests
+
+RCD_START_TIMEOUT = 15
+RCD_TIMEOUT = 300
+DEFAULT_TRANSFERS = 4
+RCLONE_EXIT_DIR_NOT_FOUND = 3  # rclone's exit code for a missing directory
+
+class RcloneError(Exception):
+    """
+    An rclone operation failed partway, e.g. a streamed listing that didn't complete.
+    """
 
 def parse_rclone_conf(conf_path):
     """
@@ -24,25 +42,260 @@ def parse_rclone_conf(conf_path):
 
     return remotes
 
-def rclone_lsjson(remote_path, rclone_config=None):
+def split_remote_path(path):
     """
-    List files on an rclone remote using lsjson.
+    Split an rclone path into the (fs, remote) pair used by the rc API.
+
+    The fs is the containing directory (e.g. 'gdrive:Anime/Show') and the
+    remote is the file name within it.
+    """
+    head, sep, tail = path.rpartition('/')
+    if sep:
+        return head or '/', tail
+    name, colon, rest = path.partition(':')
+    if colon:
+        return f"{name}:", rest
+    return '.', path
+
+class RcloneRcd:
     """
-    cmd = ['rclone', 'lsjson', remote_path]
+    A local `rclone rcd` daemon driven over its HTTP API.
+
+    One daemon serves every operation of a run, so the config is read and
+    the backends are authenticated only once. Requests go over a pooled
+    keep-alive session. Operations log their errors and return None (or
+    False) so callers can fall back to the subprocess transport.
+    """
+
+    def __init__(self, rclone_config=None, timeout=RCD_TIMEOUT, pool_size=DEFAULT_TRANSFERS):
+        self.rclone_config = rclone_config
+        self.timeout = timeout
+        self.process = None
+        self.url = None
+        self.session = requests.Session()
+        self.session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.auth = ('rclone', secrets.token_hex(16))
+
+    def start(self):
+        """
+        Start the daemon on a free local port and wait until it answers.
+
+        Returns True if the daemon is ready.
+        """
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/"
+
+        cmd = ['rclone', 'rcd', '--rc-addr', f"127.0.0.1:{port}"]
+        if self.rclone_config:
+            cmd.extend(['--config', self.rclone_config])
+
+        # Credentials go through the environment; the command line is visible to every local user
+        user, password = self.session.auth
+        env = dict(os.environ, RCLONE_RC_USER=user, RCLONE_RC_PASS=password)
+
+        try:
+            self.process = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError as e:
+            logging.error(f"Could not start rclone rcd: {e}")
+            return False
+
+        deadline = time.monotonic() + RCD_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                logging.error(f"rclone rcd exited with code {self.process.returncode} during startup.")
+                return False
+            try:
+                if self.session.post(self.url + 'rc/noop', json={}, timeout=1).ok:
+                    logging.info(f"Started rclone rcd on {self.url}")
+                    return True
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.1)
+
+        logging.error("Timed out waiting for rclone rcd to start.")
+        self.close()
+        return False
+
+    def call(self, command, not_found=None, **params):
+        """
+        Call an rc command and return its JSON result, or None on failure.
+
+        If the rc reports that the path doesn't exist, not_found is returned
+        instead.
+        """
+        if self.url is None:
+            return None
+        try:
+            response = self.session.post(self.url + command, json=params, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            logging.error(f"rclone rc call '{command}' failed: {e}")
+            return None
+        try:
+            result = response.json()
+        except ValueError:
+            result = {}
+        if response.status_code == 404 and not_found is not None:
+            return not_found
+        if not response.ok:
+            logging.error(f"rclone rc call '{command}' failed: {result.get('error', response.status_code)}")
+            return None
+        return result
+
+    def list(self, remote_path, recursive=False):
+        """
+        List a directory like `rclone lsjson`, or return None on failure.
+
+        A directory that doesn't exist is listed as empty.
+        """
+        opt = {'recurse': True} if recursive else {}
+        result = self.call('operations/list', not_found={'list': []}, fs=remote_path, remote='', opt=opt)
+        return None if result is None else result.get('list', [])
+
+    def _transfer(self, command, source_path, dest_path):
+        src_fs, src_remote = split_remote_path(source_path)
+        dst_fs, dst_remote = split_remote_path(dest_path)
+        return self.call(command, srcFs=src_fs, srcRemote=src_remote, dstFs=dst_fs, dstRemote=dst_remote) is not None
+
+    def movefile(self, source_path, dest_path):
+        """
+        Move a single file. Returns True on success.
+        """
+        return self._transfer('operations/movefile', source_path, dest_path)
+
+    def copyfile(self, source_path, dest_path):
+        """
+        Copy a single file. Returns True on success.
+        """
+        return self._transfer('operations/copyfile', source_path, dest_path)
+
+    def deletefile(self, remote_path):
+        """
+        Delete a single file. Returns True on success.
+        """
+        fs, remote = split_remote_path(remote_path)
+        return self.call('operations/deletefile', fs=fs, remote=remote) is not None
+
+    def close(self):
+        """
+        Stop the daemon and close the pooled connections.
+        """
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+        self.url = None
+        self.session.close()
+
+_rcd = None
+_rcd_lock = threading.Lock()
+
+def set_transport(transport, rclone_config=None, transfers=DEFAULT_TRANSFERS):
+    """
+    Select how rclone operations are run: 'cli' (one subprocess per
+    operation) or 'rc' (a shared rclone rcd daemon).
+
+    Falls back to 'cli' if the daemon can't be started. Returns the
+    transport in use.
+    """
+    global _rcd
+    with _rcd_lock:
+        if _rcd is not None:
+            _rcd.close()
+            _rcd = None
+        if transport != 'rc':
+            return 'cli'
+
+        rcd = RcloneRcd(rclone_config, pool_size=transfers)
+        if not rcd.start():
+            logging.warning("Falling back to running rclone as a subprocess per operation.")
+            return 'cli'
+        _rcd = rcd
+        return 'rc'
+
+def close_transport():
+    """
+    Stop the rclone rcd daemon, if one is running.
+    """
+    set_transport('cli')
+
+atexit.register(close_transport)
+
+def iter_lsjson(remote_path, rclone_config=None, recursive=False, fast_list=True, include=None):
+    """
+    Stream the files on an rclone remote from lsjson, one entry at a time.
+
+    The listing is parsed line by line as rclone writes it, so memory use
+    stays bounded on huge remotes and callers can start work before it
+    completes. Recursive listings use --fast-list where the backend
+    supports it, and include patterns are matched case-insensitively by
+    rclone itself.
+
+    Raises RcloneError once the entries are exhausted if rclone failed or
+    the listing couldn't be read completely, as the entries already
+    yielded are then only part of the remote.
+    """
+    cmd = ['rclone', 'lsjson', remote_path, '--files-only']
+    if recursive:
+        cmd.append('-R')
+        if fast_list:
+            cmd.append('--fast-list')
+    if include:
+        for pattern in include:
+            cmd.extend(['--include', pattern])
+        cmd.append('--ignore-case')
     if rclone_config:
         cmd.extend(['--config', rclone_config])
 
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return json.loads(result.stdout)
-    except (subprocess.CalledProcessError, json.JSONDecodeError) as e:
-        logging.error(f"Failed to list files on rclone remote '{remote_path}': {e}")
-        return None
+    with tempfile.TemporaryFile(mode='w+', encoding='utf-8') as stderr:
+        try:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr, text=True, encoding='utf-8')
+        except OSError as e:
+            raise RcloneError(f"Failed to list files on rclone remote '{remote_path}': {e}") from e
+
+        finished = False
+        unreadable = 0
+        try:
+            # lsjson writes one object per line between the array brackets
+            for line in process.stdout:
+                line = line.strip().rstrip(',')
+                if not line or line in ('[', ']'):
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    logging.warning(f"Skipping unreadable lsjson entry from '{remote_path}': {e}")
+                    unreadable += 1
+            finished = True
+        finally:
+            # Stop rclone if the caller stopped reading before the end
+            if not finished:
+                process.kill()
+            process.stdout.close()
+            returncode = process.wait()
+
+        if returncode != 0:
+            stderr.seek(0)
+            raise RcloneError(f"Failed to list files on rclone remote '{remote_path}': {stderr.read().strip()}")
+        if unreadable:
+            raise RcloneError(f"Could not read {unreadable} lsjson entries from rclone remote '{remote_path}'")
 
 def rclone_lsf(remote_path, rclone_config=None):
     """
     List files on an rclone remote using lsf.
+
+    A directory that doesn't exist (yet) is listed as empty. Returns None
+    if the listing failed, so it isn't mistaken for an empty directory.
     """
+    if _rcd is not None:
+        files = _rcd.list(remote_path)
+        if files is not None:
+            return [file['Name'] + ('/' if file.get('IsDir') else '') for file in files]
+
     cmd = ['rclone', 'lsf', remote_path]
     if rclone_config:
         cmd.extend(['--config', rclone_config])
@@ -51,13 +304,18 @@ def rclone_lsf(remote_path, rclone_config=None):
         result = subprocess.run(cmd, capture_output=True, text=True, check=True)
         return result.stdout.splitlines()
     except subprocess.CalledProcessError as e:
+        if e.returncode == RCLONE_EXIT_DIR_NOT_FOUND:
+            return []
         logging.error(f"Failed to list files on rclone remote '{remote_path}': {e}")
-        return []
+        return None
 
 def rclone_moveto(source_path, dest_path, rclone_config=None):
     """
     Move a file on an rclone remote using moveto.
     """
+    if _rcd is not None and _rcd.movefile(source_path, dest_path):
+        return True
+
     cmd = ['rclone', 'moveto', source_path, dest_path]
     if rclone_config:
         cmd.extend(['--config', rclone_config])
@@ -73,6 +331,9 @@ def rclone_copyto(source_path, dest_path, rclone_config=None):
     """
     Copy a file to an rclone remote using copyto.
     """
+    if _rcd is not None and _rcd.copyfile(source_path, dest_path):
+        return True
+
     cmd = ['rclone', 'copyto', source_path, dest_path]
     if rclone_config:
         cmd.extend(['--config', rclone_config])
@@ -88,6 +349,9 @@ def rclone_delete(remote_path, rclone_config=None):
     """
     Delete a file on an rclone remote.
     """
+    if _rcd is not None and _rcd.deletefile(remote_path):
+        return True
+
     cmd = ['rclone', 'delete', remote_path]
     if rclone_config:
         cmd.extend(['--config', rclone_config])
@@ -98,3 +362,253 @@ def rclone_delete(remote_path, rclone_config=None):
     except subprocess.CalledProcessError as e:
         logging.error(f"Failed to delete file '{remote_path}': {e}")
         return False
+
+class RemoteNamespace:
+    """
+    In-memory model of the file names on an rclone remote.
+
+    Seeded from the lsjson listing taken when the remote is scanned and kept
+    up to date as renames are planned and performed, so collision checks
+    don't need a listing per file. Directories that weren't part of the
+    listing are fetched with lsf once, on first use, unless the listing was
+    a complete recursive one (see mark_complete).
+
+    Paths are relative to the remote; full "remote:path" paths are accepted
+    too.
+    """
+
+    def __init__(self, remote, rclone_config=None):
+        self.remote = remote
+        self.rclone_config = rclone_config
+        self._dirs = {}
+        self._complete = False
+        self._moves = {}
+        self._lock = threading.Lock()
+
+    def _relative(self, path):
+        prefix = f"{self.remote}:"
+        return path[len(prefix):] if path.startswith(prefix) else path
+
+    def record(self, entry, recursive=False):
+        """
+        Load a single lsjson entry, e.g. while the listing is still streaming in.
+        """
+        dir_path = os.path.dirname(entry['Path'])
+        with self._lock:
+            if recursive and entry.get('IsDir'):
+                self._dirs.setdefault(entry['Path'], set())
+            if recursive or not dir_path:
+                self._dirs.setdefault(dir_path, set()).add(os.path.basename(entry['Path']))
+
+    def clear(self):
+        """
+        Forget every known directory, e.g. after an incomplete listing.
+        """
+        with self._lock:
+            self._dirs = {}
+            self._complete = False
+
+    def mark_complete(self):
+        """
+        Note that a complete recursive listing has been recorded, so any
+        directory not seen in it has none of the listed files.
+        """
+        with self._lock:
+            self._complete = True
+
+    def names(self, dir_path):
+        """
+        Get the set of names in a directory, listing it if it isn't known yet.
+
+        Returns None if the directory couldn't be listed; the failure isn't
+        remembered, so the next call lists it again.
+        """
+        dir_path = self._relative(dir_path)
+        with self._lock:
+            if self._complete:
+                return set(self._dirs.setdefault(dir_path, set()))
+            if dir_path in self._dirs:
+                return set(self._dirs[dir_path])
+
+        listing = rclone_lsf(f"{self.remote}:{dir_path}", self.rclone_config)
+        if listing is None:
+            return None
+        listed = {name.rstrip('/') for name in listing}
+        with self._lock:
+            return set(self._dirs.setdefault(dir_path, listed))
+
+    def add(self, path):
+        """
+        Record a file at the given path, e.g. the destination of a planned move.
+        """
+        path = self._relative(path)
+        if self.names(os.path.dirname(path)) is None:
+            return
+        with self._lock:
+            self._dirs[os.path.dirname(path)].add(os.path.basename(path))
+
+    def discard(self, path):
+        """
+        Forget the file at the given path, e.g. the source of a completed move.
+        """
+        path = self._relative(path)
+        with self._lock:
+            self._dirs.get(os.path.dirname(path), set()).discard(os.path.basename(path))
+
+    def track_move(self, source_path, dest_path, future):
+        """
+        Track a queued move whose destination has already been added.
+
+        Once the move finishes, the source is dropped if it succeeded, or
+        the destination released if it failed.
+        """
+        source_path = self._relative(source_path)
+        with self._lock:
+            self._moves[source_path] = (dest_path, future)
+        future.add_done_callback(lambda done: self._settle(source_path))
+
+    def _settle(self, source_path):
+        # Popping the move and updating the names happen under one lock, so
+        # a caller of wait_for_move never sees a half-applied outcome
+        with self._lock:
+            move = self._moves.pop(source_path, None)
+            if move is None:
+                return
+            dest_path, future = move
+            path = source_path if not future.cancelled() and future.result() else self._relative(dest_path)
+            self._dirs.get(os.path.dirname(path), set()).discard(os.path.basename(path))
+
+    def wait_for_move(self, path):
+        """
+        If the file at the given path is the source of a queued move, wait
+        for the move and apply its outcome. Returns True if there was one.
+
+        Whether a name is free then depends only on the moves' outcomes,
+        not on how far the pool has got.
+        """
+        path = self._relative(path)
+        with self._lock:
+            move = self._moves.get(path)
+        if move is None:
+            return False
+        concurrent.futures.wait([move[1]])
+        self._settle(path)
+        return True
+
+def rclone_move(source_path, dest_path, rclone_config=None):
+    """
+    Move a file, falling back to copy and delete if moveto fails.
+    """
+    if rclone_moveto(source_path, dest_path, rclone_config):
+        return True
+    if rclone_copyto(source_path, dest_path, rclone_config):
+        return rclone_delete(source_path, rclone_config)
+    return False
+
+def get_remote_name(path):
+    """
+    Get the remote name of an rclone path ('gdrive' for 'gdrive:Anime'),
+    or '' for a local path.
+    """
+    name, colon, _ = path.partition(':')
+    return name if colon and '/' not in name else ''
+
+class RcloneOperationPool:
+    """
+    Runs rclone moves, copies and deletes on worker threads.
+
+    Each remote gets its own workers, limited to its entry in limits (or
+    default_limit), so a remote that tolerates little parallelism doesn't
+    hold back the others. Operations are keyed to their source remote and
+    return futures that resolve to True on success.
+    """
+
+    def __init__(self, rclone_config=None, limits=None, default_limit=DEFAULT_TRANSFERS):
+        self.rclone_config = rclone_config
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self._executors = {}
+        self._pending = set()
+        self._finished = 0
+        self._failed = []
+        self._lock = threading.Condition()
+
+    def _executor(self, remote):
+        with self._lock:
+            if remote not in self._executors:
+                limit = max(1, self.limits.get(remote, self.default_limit))
+                self._executors[remote] = concurrent.futures.ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f"rclone-{remote or 'local'}")
+            return self._executors[remote]
+
+    def _run(self, func, *args):
+        try:
+            return func(*args, self.rclone_config)
+        except Exception as e:
+            logging.error(f"rclone operation {func.__name__}{args} failed: {e}")
+            return False
+
+    def submit(self, operation, func, *paths):
+        """
+        Queue func(*paths, rclone_config) on the workers of the first path's remote.
+        """
+        future = self._executor(get_remote_name(paths[0])).submit(self._run, func, *paths)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(lambda done: self._record(operation, paths, done))
+        return future
+
+    def _record(self, operation, paths, future):
+        with self._lock:
+            self._pending.discard(future)
+            self._finished += 1
+            if future.cancelled() or not future.result():
+                self._failed.append((operation, paths))
+            self._lock.notify_all()
+
+    def move(self, source_path, dest_path):
+        """
+        Queue a move (falling back to copy and delete).
+        """
+        return self.submit('move', rclone_move, source_path, dest_path)
+
+    def copy(self, source_path, dest_path):
+        """
+        Queue a copy.
+        """
+        return self.submit('copy', rclone_copyto, source_path, dest_path)
+
+    def delete(self, remote_path):
+        """
+        Queue a delete.
+        """
+        return self.submit('delete', rclone_delete, remote_path)
+
+    def wait(self):
+        """
+        Wait for every queued operation and return the aggregate result of
+        those finished since the last wait():
+        {'total', 'succeeded', 'failed': [(operation, paths), ...]}.
+        """
+        with self._lock:
+            while self._pending:
+                self._lock.wait()
+            result = {'total': self._finished, 'succeeded': self._finished - len(self._failed), 'failed': self._failed}
+            self._finished = 0
+            self._failed = []
+        return result
+
+    def close(self):
+        """
+        Wait for the queued operations and stop the workers.
+        """
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors = {}
+        for executor in executors:
+            executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
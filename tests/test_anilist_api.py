@@ -2,25 +2,40 @@
 # -*- coding: utf-8 -*-
 
 import sys
+import time
 from unittest.mock import patch, MagicMock
 
 # Mock requests and its exceptions before importing anilist_api
+_real_modules = {name: sys.modules.get(name) for name in ("requests", "cache")}
 mock_requests = MagicMock()
 mock_requests.exceptions.RequestException = Exception
 sys.modules["requests"] = mock_requests
 
 # Mock cache to avoid side effects and dependency issues
 mock_cache = MagicMock()
+mock_cache.get_franchise_graph.return_value = None
 sys.modules["cache"] = mock_cache
 
 import anilist_api
 import pytest
 
+mock_session = mock_requests.Session.return_value
+
+# Restore the real modules so other test files are not affected by the mocks
+for _name, _module in _real_modules.items():
+    if _module is None:
+        sys.modules.pop(_name, None)
+    else:
+        sys.modules[_name] = _module
+
+import cache as real_cache
+mock_cache.normalize_title.side_effect = real_cache.normalize_title
+
 def test_search_anime_timeout():
     """
-    Test that search_anime calls requests.post with a timeout.
+    Test that search_anime calls session.post with a timeout.
     """
-    mock_post = mock_requests.post
+    mock_post = mock_session.post
     mock_post.return_value.json.return_value = {'data': {'Page': {'media': []}}}
     mock_post.return_value.status_code = 200
 
@@ -29,23 +44,24 @@ def test_search_anime_timeout():
 
     anilist_api.search_anime("Test Anime")
 
-    # Check if timeout was passed to requests.post
+    # Check if timeout was passed to session.post
     args, kwargs = mock_post.call_args
-    assert 'timeout' in kwargs, "requests.post was called without a timeout in search_anime"
+    assert 'timeout' in kwargs, "session.post was called without a timeout in search_anime"
     assert isinstance(kwargs['timeout'], (int, float)), "timeout should be a number"
 
 def test_get_anime_season_data_timeout():
     """
-    Test that get_anime_season_data calls requests.post with a timeout.
+    Test that get_anime_season_data calls session.post with a timeout.
     """
     # Reset mock to clear previous calls
-    mock_requests.post.reset_mock()
-    mock_post = mock_requests.post
+    mock_session.post.reset_mock()
+    mock_post = mock_session.post
     mock_post.return_value.json.return_value = {
         'data': {
-            'Media': {
+            'm0': {
                 'id': 1,
                 'title': {'romaji': 'Test Anime', 'english': 'Test Anime'},
+                'format': 'TV',
                 'episodes': 12,
                 'relations': {'edges': []}
             }
@@ -58,8 +74,288 @@ def test_get_anime_season_data_timeout():
 
     anilist_api.get_anime_season_data(1)
 
-    # Check if timeout was passed to requests.post
-    assert mock_post.called, "requests.post was not called in get_anime_season_data"
+    # Check if timeout was passed to session.post
+    assert mock_post.called, "session.post was not called in get_anime_season_data"
     args, kwargs = mock_post.call_args
-    assert 'timeout' in kwargs, "requests.post was called without a timeout in get_anime_season_data"
+    assert 'timeout' in kwargs, "session.post was called without a timeout in get_anime_season_data"
     assert isinstance(kwargs['timeout'], (int, float)), "timeout should be a number"
+
+def test_search_anime_batch_single_request():
+    """
+    Test that search_anime_batch packs several titles into one aliased query
+    and caches the results per normalized title, including titles with no
+    results.
+    """
+    mock_session.post.reset_mock()
+    mock_cache.reset_mock()
+    mock_cache.get_cached_data.return_value = None
+    mock_cache.get_cache_key.side_effect = lambda prefix, query: f"{prefix}_{query}"
+    mock_session.post.return_value.json.return_value = {
+        'data': {
+            's0': {'media': [{'id': 1}]},
+            's1': {'media': []},
+        }
+    }
+
+    results = anilist_api.search_anime_batch(["Show A", "Show B", "show.a "])
+
+    assert mock_session.post.call_count == 1
+    _, kwargs = mock_session.post.call_args
+    assert kwargs['json']['variables'] == {'s0': "Show A", 's1': "Show B"}
+    assert results == {"Show A": [{'id': 1}], "Show B": [], "show.a ": [{'id': 1}]}
+    mock_cache.save_to_cache.assert_any_call("search_show a", [{'id': 1}])
+    mock_cache.save_to_cache.assert_any_call("search_show b", [], mock_cache.get_negative_cache_duration.return_value)
+    mock_cache.get_cache_key.side_effect = None
+
+def test_rate_limiter_only_blocks_when_exhausted():
+    """
+    Test that the rate limiter allows bursts and honours the rate-limit headers.
+    """
+    limiter = anilist_api.RateLimiter(per_minute=60)
+    assert limiter.wait_time() == 0
+
+    limiter.update({'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '0'})
+    assert limiter.wait_time() > 0
+
+    limiter = anilist_api.RateLimiter(per_minute=60)
+    limiter.update({'Retry-After': '30'})
+    assert 29 < limiter.wait_time() <= 30
+
+def test_rate_limiter_update_extends_a_pending_wait():
+    """
+    Test that a waiting acquire doesn't block updates and honours them.
+    """
+    import threading
+
+    limiter = anilist_api.RateLimiter(per_minute=60)
+    limiter.tokens = 0
+    acquired = threading.Event()
+    waiter = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+    waiter.start()
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    limiter.update({'Retry-After': '30'})
+    assert time.monotonic() - started < 0.5
+    assert not acquired.wait(1.5)
+
+    limiter.blocked_until = 0.0
+    limiter.tokens = 1
+    limiter.block_for(0)
+    assert acquired.wait(1)
+    waiter.join(1)
+
+def test_post_query_retries_on_429():
+    """
+    Test that a 429 response is retried instead of failing the lookup.
+    """
+    limited = MagicMock(status_code=429, headers={'Retry-After': '0'})
+    ok = MagicMock(status_code=200, headers={})
+    ok.json.return_value = {'data': {'Media': {}}}
+    mock_session.post.reset_mock()
+    mock_session.post.side_effect = [limited, ok]
+
+    try:
+        assert anilist_api.post_query('query', {}) == {'data': {'Media': {}}}
+        assert mock_session.post.call_count == 2
+        limited.raise_for_status.assert_not_called()
+    finally:
+        mock_session.post.side_effect = None
+
+def test_default_client_reuses_session():
+    """
+    Test that module-level calls share one pooled session.
+    """
+    mock_cache.get_cached_data.return_value = None
+    mock_session.post.return_value.json.return_value = {'data': {'Page': {'media': []}}}
+    mock_session.post.return_value.status_code = 200
+
+    anilist_api.search_anime("First")
+    anilist_api.search_anime("Second")
+
+    assert mock_requests.Session.call_count == 1
+    assert anilist_api.get_default_client().session is mock_session
+
+def test_async_client_runs_lookups_concurrently():
+    """
+    Test that the async client splits batches and deduplicates season lookups.
+    """
+    import asyncio
+    import anilist_aio
+
+    client = MagicMock()
+    client.search_anime_batch.side_effect = lambda titles, force_refresh: {title: [] for title in titles}
+    client.get_anime_season_data.side_effect = lambda anime_id, force_refresh: [{'id': anime_id}]
+    aio_client = anilist_aio.AsyncAniListClient(client=client, concurrency=2)
+
+    titles = [f"Show {i}" for i in range(anilist_api.SEARCH_BATCH_SIZE + 1)]
+    results = asyncio.run(aio_client.search_anime_batch(titles))
+    seasons = asyncio.run(aio_client.get_many_season_data([1, 2, 1]))
+
+    assert set(results) == set(titles)
+    assert client.search_anime_batch.call_count == 2
+    assert seasons == {1: [{'id': 1}], 2: [{'id': 2}]}
+    assert client.get_anime_season_data.call_count == 2
+
+def _media(media_id, *related):
+    return {
+        'id': media_id,
+        'title': {'romaji': f"Show {media_id}", 'english': None},
+        'format': 'TV',
+        'episodes': 12,
+        'relations': {'edges': [
+            {'relationType': relation, 'node': {'id': other, 'format': 'TV'}} for relation, other in related
+        ]},
+    }
+
+def test_get_anime_season_data_fetches_one_level_per_request():
+    """
+    Test that the season chain is resolved breadth-first, one request per level,
+    and that the whole franchise graph is cached.
+    """
+    mock_session.post.reset_mock()
+    mock_cache.reset_mock()
+    mock_cache.get_cached_data.return_value = None
+    responses = [
+        {'data': {'m0': _media(2, ('PREQUEL', 1), ('SEQUEL', 3))}},
+        {'data': {'m0': _media(1, ('SEQUEL', 2)), 'm1': _media(3, ('PREQUEL', 2))}},
+    ]
+    mock_session.post.return_value.status_code = 200
+    mock_session.post.return_value.json.side_effect = responses
+
+    try:
+        seasons = anilist_api.get_anime_season_data(2)
+    finally:
+        mock_session.post.return_value.json.side_effect = None
+
+    assert mock_session.post.call_count == 2
+    assert sorted(season['id'] for season in seasons) == [1, 2, 3]
+    graph = mock_cache.save_to_franchise_graph.call_args.args[0]
+    assert set(graph) == {'1', '2', '3'}
+
+def test_get_anime_season_data_uses_cached_franchise_graph():
+    """
+    Test that any member of a cached franchise is resolved without a request.
+    """
+    graph = {
+        str(media['id']): anilist_api._media_node(media)
+        for media in (_media(1, ('SEQUEL', 2)), _media(2, ('PREQUEL', 1), ('SEQUEL', 3)), _media(3, ('PREQUEL', 2)))
+    }
+    mock_session.post.reset_mock()
+    mock_cache.get_franchise_graph.return_value = graph
+
+    try:
+        seasons = anilist_api.get_anime_season_data(3)
+    finally:
+        mock_cache.get_franchise_graph.return_value = None
+
+    mock_session.post.assert_not_called()
+    assert [season['id'] for season in seasons] == [3, 2, 1]
+
+def test_single_flight_shares_one_call():
+    """
+    Test that concurrent callers with the same key share a single execution.
+    """
+    import threading
+
+    flights = anilist_api.SingleFlight()
+    started = threading.Event()
+    finish = threading.Event()
+    calls = []
+
+    def slow_lookup():
+        calls.append(1)
+        started.set()
+        finish.wait(5)
+        return 'result'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do('key', slow_lookup)))
+    leader.start()
+    started.wait(5)
+
+    future, is_leader = flights.claim('key')
+    assert not is_leader
+    finish.set()
+    leader.join(5)
+
+    assert future.result(5) == 'result'
+    assert results == ['result']
+    assert len(calls) == 1
+
+def test_search_anime_serves_cached_empty_results():
+    """
+    Test that a cached empty result is not treated as a cache miss.
+    """
+    mock_session.post.reset_mock()
+    mock_cache.get_cached_data.return_value = []
+
+    try:
+        assert anilist_api.search_anime("Unknown Show") == []
+        assert anilist_api.search_anime_batch(["Unknown Show"]) == {"Unknown Show": []}
+    finally:
+        mock_cache.get_cached_data.return_value = None
+
+    mock_session.post.assert_not_called()
+
+def test_stale_while_revalidate_serves_expired_entry():
+    """
+    Test that an expired entry is returned at once and refreshed in the background.
+    """
+    client = anilist_api.AniListClient(stale_while_revalidate=True)
+    mock_session.post.reset_mock()
+    mock_session.post.return_value.status_code = 200
+    mock_session.post.return_value.json.return_value = {'data': {'Page': {'media': [{'id': 2}]}}}
+    mock_cache.get_cached_data.return_value = None
+    mock_cache.get_cached_entry.return_value = ([{'id': 1}], True)
+
+    try:
+        assert client.search_anime("Old Show") == [{'id': 1}]
+        client.wait_for_revalidation()
+    finally:
+        mock_cache.get_cached_entry.return_value = None
+
+    assert mock_session.post.call_count == 1
+
+def test_offline_mode_serves_cache_without_requests():
+    """
+    Test that an offline client serves expired entries and never sends a request.
+    """
+    client = anilist_api.AniListClient(offline=True)
+    mock_session.post.reset_mock()
+    mock_cache.get_cache_key.side_effect = lambda prefix, query: f"{prefix}_{query}"
+    mock_cache.get_cached_entry.side_effect = lambda key: ([{'id': 1}], True) if 'cached' in key else (None, False)
+    mock_cache.get_franchise_graph.return_value = {'1': {'id': 1, 'title': {}, 'episodes': 12, 'relations': []}}
+
+    try:
+        assert client.search_anime("Cached Show") == [{'id': 1}]
+        assert client.search_anime_batch(["Cached Show", "Unknown Show"]) == {"Cached Show": [{'id': 1}], "Unknown Show": None}
+        assert client.get_anime_season_data(1) == [{'id': 1, 'title': {}, 'episodes': 12}]
+        assert client.post_query("query", {}) is None
+    finally:
+        mock_cache.get_cache_key.side_effect = None
+        mock_cache.get_cached_entry.side_effect = None
+        mock_cache.get_franchise_graph.return_value = None
+
+    mock_cache.get_franchise_graph.assert_called_with(1, allow_stale=True)
+    assert mock_session.post.call_count == 0
+
+def test_search_sends_original_title():
+    """
+    Test that the normalized title is only used for the cache key, not as the search text.
+    """
+    mock_session.post.reset_mock()
+    mock_cache.reset_mock()
+    mock_cache.get_cached_data.return_value = None
+    mock_cache.get_cache_key.side_effect = lambda prefix, query: f"{prefix}_{query}"
+    mock_session.post.return_value.status_code = 200
+    mock_session.post.return_value.json.return_value = {'data': {'Page': {'media': [{'id': 1}]}}}
+
+    try:
+        assert anilist_api.AniListClient().search_anime("Fate/Zero") == [{'id': 1}]
+    finally:
+        mock_cache.get_cache_key.side_effect = None
+
+    _, kwargs = mock_session.post.call_args
+    assert kwargs['json']['variables'] == {'search': "Fate/Zero"}
+    mock_cache.save_to_cache.assert_called_with("search_fate zero", [{'id': 1}])
@@ -1,11 +1,16 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import gzip
+import json
 import os
 import shutil
 import sys
+import time
 from unittest.mock import MagicMock, patch
 
+import pytest
+
 # Mock yaml to allow importing config without it being installed
 sys.modules['yaml'] = MagicMock()
 
@@ -30,6 +35,13 @@ def test_get_cache_duration():
         mock_load.return_value = {'anilist_cache': {'duration': 2}}
         assert cache.get_cache_duration() == 7200
 
+def test_get_cache_duration_per_prefix():
+    """Test that prefix_durations override the default duration for their prefix."""
+    with patch('config.load_config') as mock_load:
+        mock_load.return_value = {'anilist_cache': {'duration': 2, 'prefix_durations': {'franchise': 48}}}
+        assert cache.get_cache_duration('franchise') == 48 * 3600
+        assert cache.get_cache_duration('search') == 7200
+
 def test_cache_functionality():
     """Test save and retrieve functionality with a custom directory."""
     test_dir = '.temp_test_cache'
@@ -54,3 +66,431 @@ def test_cache_functionality():
     # Clean up
     if os.path.exists(test_dir):
         shutil.rmtree(test_dir)
+
+def test_franchise_graph_shared_by_members():
+    """Test that every member of a saved franchise finds the same graph."""
+    test_dir = '.temp_test_cache'
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+    graph = {
+        '10': {'id': 10, 'relations': [{'id': 20, 'relationType': 'SEQUEL', 'format': 'TV'}]},
+        '20': {'id': 20, 'relations': [{'id': 10, 'relationType': 'PREQUEL', 'format': 'TV'}]},
+    }
+    with patch('cache.get_cache_dir', return_value=test_dir):
+        with patch('cache.get_cache_duration', return_value=3600):
+            assert cache.get_franchise_graph(10) is None
+
+            cache.save_to_franchise_graph(graph)
+
+            assert cache.get_franchise_graph(10) == graph
+            assert cache.get_franchise_graph(20) == graph
+            assert cache.get_franchise_graph(30) is None
+
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+def test_sqlite_backend_and_migration():
+    """Test the SQLite backend and migrating the file cache into it."""
+    test_dir = '.temp_test_cache'
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+    with patch('cache.get_cache_dir', return_value=test_dir):
+        with patch('cache.get_cache_duration', return_value=3600):
+            key = cache.get_cache_key('search', 'query')
+            cache.save_to_cache(key, ['file entry'])
+
+            backend = cache.SQLiteCacheBackend(os.path.join(test_dir, 'cache.sqlite3'))
+            assert backend.read(key) is None
+            assert cache.migrate_file_cache(backend=backend) == 1
+            assert backend.read(key)['payload'] == ['file entry']
+
+            with patch('cache.get_backend', return_value=backend):
+                cache.save_to_cache(key, ['sqlite entry'])
+                assert cache.get_cached_data(key) == ['sqlite entry']
+            backend.close()
+
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+def test_memory_cache_tier():
+    """Test that repeated lookups are served from the bounded in-memory tier."""
+    test_dir = '.temp_test_cache'
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+    with patch('cache.get_cache_dir', return_value=test_dir):
+        with patch('cache.get_cache_duration', return_value=3600):
+            with patch('cache._memory_cache', cache.MemoryCache(2)):
+                keys = [cache.get_cache_key('test', str(i)) for i in range(3)]
+                for i, key in enumerate(keys):
+                    cache.save_to_cache(key, i)
+
+                # Remove the files so only the memory tier can answer
+                shutil.rmtree(test_dir)
+
+                assert cache.get_cached_data(keys[2]) == 2
+                assert cache.get_cached_data(keys[1]) == 1
+                assert cache.get_cached_data(keys[0]) is None  # Evicted as least recently used
+
+                stats = cache.get_memory_cache_stats()
+                assert stats['entries'] == 2
+                assert stats['hits'] == 2
+                assert stats['misses'] == 1
+
+def test_negative_cache_entries():
+    """Test that empty payloads are cached hits with their own duration."""
+    test_dir = '.temp_test_cache'
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+    with patch('cache.get_cache_dir', return_value=test_dir):
+        with patch('cache.get_cache_duration', return_value=3600):
+            with patch('cache._memory_cache', cache.MemoryCache(0)):
+                key = cache.get_cache_key('search', 'no such show')
+                cache.save_to_cache(key, [], duration=60)
+                assert cache.get_cached_data(key) == []
+
+                with patch('cache.time.time', return_value=time.time() + 120):
+                    assert cache.get_cached_data(key) is None
+
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+def test_get_cached_entry_returns_expired_payload():
+    """Test that expired entries stay readable for stale-while-revalidate."""
+    test_dir = '.temp_test_cache'
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+    with patch('cache.get_cache_dir', return_value=test_dir):
+        with patch('cache.get_cache_duration', return_value=3600):
+            key = cache.get_cache_key('search', 'old show')
+            cache.save_to_cache(key, ['old'])
+            assert cache.get_cached_entry(key) == (['old'], False)
+
+            with patch('cache.time.time', return_value=time.time() + 7200):
+                assert cache.get_cached_entry(key) == (['old'], True)
+                assert cache.get_cached_data(key) is None
+
+            assert cache.get_cached_entry(cache.get_cache_key('search', 'unknown')) == (None, False)
+
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+def test_prune_cache_drops_expired_and_evicts_lru():
+    """Test that pruning removes expired entries and enforces max_entries."""
+    test_dir = '.temp_test_cache'
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+    limits = {'max_entries': 2, 'max_size': 0, 'eviction_policy': 'lru', 'compaction_interval': 3600}
+    with patch('cache.get_cache_dir', return_value=test_dir):
+        with patch('cache.get_cache_duration', return_value=3600):
+            with patch('cache.get_cache_limits', return_value=limits):
+                keys = [cache.get_cache_key('test', str(i)) for i in range(4)]
+                cache.save_to_cache(keys[0], 'expired', duration=-1)
+                for i, key in enumerate(keys[1:], 1):
+                    cache.save_to_cache(key, i)
+                    os.utime(cache.FileCacheBackend().get_path(key), (1000 + i, 1000 + i))
+
+                stats = cache.get_cache_stats()
+                assert stats['entries'] == 4
+                assert stats['expired'] == 1
+                assert stats['prefixes']['test']['entries'] == 4
+
+                assert cache.prune_cache() == {'expired': 1, 'evicted': 1}
+                assert sorted(cache.FileCacheBackend().keys()) == sorted(keys[2:])
+                assert cache.maybe_compact() is None  # Just compacted
+
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+def test_sqlite_prune_follows_configured_durations():
+    """Test that SQLite pruning uses the durations configured now, not at write time."""
+    test_dir = '.temp_test_cache'
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+    limits = {'max_entries': 0, 'max_size': 0, 'eviction_policy': 'lru', 'compaction_interval': 3600}
+    conf = {'anilist_cache': {'duration': 24, 'prefix_durations': {'franchise': 1}}}
+    with patch('config.load_config', return_value=conf), patch('cache.get_cache_dir', return_value=test_dir):
+        with patch('cache.get_cache_limits', return_value=limits):
+            backend = cache.SQLiteCacheBackend(os.path.join(test_dir, 'cache.sqlite3'))
+            two_hours_ago = time.time() - 2 * 3600
+            backend.write('search_a.json', {'timestamp': two_hours_ago, 'payload': ['a']})
+            backend.write('franchise_1.json', {'timestamp': two_hours_ago, 'payload': {'1': {}}})
+            backend.write('media_1.json', {'timestamp': two_hours_ago, 'duration': 60, 'payload': {}})
+
+            assert cache.prune_cache(backend=backend) == {'expired': 2, 'evicted': 0}
+            assert backend.keys() == ['search_a.json']
+
+            conf['anilist_cache']['duration'] = 1
+            assert cache.prune_cache(backend=backend) == {'expired': 1, 'evicted': 0}
+            assert backend.keys() == []
+            backend.close()
+
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+def test_atomic_write_and_fetch_lock():
+    """Test that writes leave no temporary files and fetch locks are exclusive."""
+    test_dir = '.temp_test_cache'
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+    with patch('cache.get_cache_dir', return_value=test_dir):
+        with patch('cache.get_cache_duration', return_value=3600):
+            key = cache.get_cache_key('search', 'query')
+            cache.save_to_cache(key, ['first'])
+            cache.save_to_cache(key, ['second'])
+            backend = cache.FileCacheBackend()
+            assert os.listdir(os.path.dirname(backend.get_path(key))) == [key]
+            assert backend.read(key)['payload'] == ['second']
+
+            with cache.FetchLock(key) as lock:
+                assert not lock.waited
+                assert not cache.FetchLock(key).try_acquire()
+            stale_holder = cache.FetchLock(key)
+            assert stale_holder.try_acquire()
+
+            # A lock whose holder died is taken over once it is too old, and
+            # the old holder's release must not remove the new holder's lock
+            abandoned = cache.FetchLock(key, timeout=0)
+            time.sleep(0.01)
+            assert abandoned.try_acquire()
+            stale_holder.release()
+            assert os.path.exists(abandoned.path) and abandoned.is_owned()
+            abandoned.release()
+            assert not os.path.exists(abandoned.path)
+
+            # A held lock is kept fresh, so it isn't taken for abandoned
+            with cache.FetchLock(key, timeout=0.4):
+                time.sleep(0.6)
+                assert not cache.FetchLock(key, timeout=0.4).try_acquire()
+
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+def test_compressed_values_round_trip():
+    """Test every storage format round-trips and old plain JSON stays readable."""
+    value = {'timestamp': 1.0, 'payload': [{'title': {'romaji': 'Show'}, 'synonyms': ['Show'] * 20}]}
+    for compression in ('none', 'zlib', 'lzma', 'msgpack'):
+        if compression == 'msgpack' and cache.msgpack is None:
+            continue
+        encoded = cache.encode_value(value, compression)
+        assert cache.decode_value(encoded) == value
+    assert len(cache.encode_value(value, 'zlib')) < len(cache.encode_value(value, 'none'))
+    assert cache.decode_value('{"payload": 1}') == {'payload': 1}
+
+    test_dir = '.temp_test_cache'
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+    with patch('cache.get_cache_dir', return_value=test_dir):
+        with patch('cache.get_cache_compression', return_value='lzma'):
+            key = cache.get_cache_key('search', 'query')
+            backend = cache.FileCacheBackend()
+            backend.write(key, value)
+            with open(backend.get_path(key), 'rb') as f:
+                assert f.read(1) == b'X'
+            assert backend.read(key) == value
+
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+def test_sharded_layout_reads_flat_entries():
+    """Test that entries are sharded and old flat entries are still found."""
+    test_dir = '.temp_test_cache'
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+    with patch('cache.get_cache_dir', return_value=test_dir):
+        backend = cache.FileCacheBackend()
+        key = cache.get_cache_key('search', 'query')
+        digest = key.split('_')[1]
+
+        backend.write(key, {'timestamp': 1.0, 'payload': 'sharded'})
+        assert backend.get_path(key) == os.path.join(test_dir, digest[:2], digest[2:4], key)
+
+        flat_key = cache.get_cache_key('search', 'old entry')
+        with open(os.path.join(test_dir, flat_key), 'w', encoding='utf-8') as f:
+            f.write('{"timestamp": 1.0, "payload": "flat"}')
+
+        assert sorted(backend.keys()) == sorted([key, flat_key])
+        assert backend.read(flat_key)['payload'] == 'flat'
+        assert not os.path.exists(os.path.join(test_dir, flat_key))  # Moved into its shard
+        assert sorted(backend.keys()) == sorted([key, flat_key])
+
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+def test_normalize_title():
+    """Test that spelling variants of a title normalize to the same key."""
+    variants = ["Shingeki no Kyojin", "shingeki no kyojin ", "Shingeki.no.Kyojin", "Ｓｈｉｎｇｅｋｉ_no  Kyojin"]
+    assert {cache.normalize_title(title) for title in variants} == {"shingeki no kyojin"}
+    assert cache.normalize_title("Re:Zero") == "re zero"
+    assert cache.normalize_title("進撃の巨人") == "進撃の巨人"
+    assert cache.normalize_title(" ??? ") == "???"
+    assert cache.get_cache_key('search', cache.normalize_title("???")) != cache.get_cache_key('search', cache.normalize_title("!!"))
+
+def test_export_and_import_bundle():
+    """Test that bundles carry entries between caches, keeping the newest."""
+    test_dir = '.temp_test_cache'
+    other_dir = '.temp_test_cache_other'
+    for path in (test_dir, other_dir):
+        if os.path.exists(path):
+            shutil.rmtree(path)
+    os.makedirs(test_dir)
+    bundle = os.path.join(test_dir, 'bundle.json.gz')
+
+    key_a = cache.get_cache_key('search', 'a')
+    key_b = cache.get_cache_key('search', 'b')
+    key_c = cache.get_cache_key('franchise', 'c')
+    with patch('cache.get_cache_duration', return_value=3600):
+        source = cache.FileCacheBackend(test_dir)
+        source.write(key_a, {'timestamp': 200, 'payload': ['new a']})
+        source.write(key_b, {'timestamp': 100, 'payload': ['old b']})
+        source.write(key_c, {'timestamp': 100, 'payload': {}})
+        assert cache.export_bundle(bundle, prefixes=['search'], backend=source) == 2
+
+        target = cache.FileCacheBackend(other_dir)
+        target.write(key_a, {'timestamp': 100, 'payload': ['old a']})
+        target.write(key_b, {'timestamp': 300, 'payload': ['new b']})
+        assert cache.import_bundle(bundle, backend=target) == 1
+        assert target.read(key_a)['payload'] == ['new a']
+        assert target.read(key_b)['payload'] == ['new b']
+        assert target.read(key_c) is None
+
+        assert cache.import_bundle(os.path.join(test_dir, 'missing.json.gz'), backend=target) is None
+
+    for path in (test_dir, other_dir):
+        if os.path.exists(path):
+            shutil.rmtree(path)
+
+def test_import_bundle_rejects_malicious_keys():
+    """Test that bundle keys can't write or delete files outside the cache directory."""
+    test_dir = '.temp_test_cache'
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+    cache_dir = os.path.join(test_dir, 'a', 'b', 'cache')
+    os.makedirs(cache_dir)
+    bundle = os.path.join(test_dir, 'bundle.json.gz')
+    victim = os.path.join(test_dir, 'pwned_abcd.json')
+    with open(victim, 'w', encoding='utf-8') as f:
+        f.write('keep me')
+
+    entries = {
+        './../../../pwned_abcd.json': {'timestamp': 100, 'payload': ['evil']},
+        cache.get_cache_key('search', 'ok'): {'timestamp': 100, 'payload': ['ok']},
+    }
+    with open(bundle, 'wb') as f:
+        f.write(gzip.compress(json.dumps({'version': cache.BUNDLE_VERSION, 'entries': entries}).encode('utf-8')))
+
+    backend = cache.FileCacheBackend(cache_dir)
+    assert cache.import_bundle(bundle, backend=backend) == 1
+    with open(victim, encoding='utf-8') as f:
+        assert f.read() == 'keep me'
+    assert not os.path.exists(os.path.join(test_dir, 'a', 'pwned_abcd.json'))
+
+    with pytest.raises(ValueError):
+        backend.write('../pwned_abcd.json', {'timestamp': 100, 'payload': ['evil']})
+
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+def test_finished_franchise_graph_uses_finished_duration():
+    """Test that graphs of finished shows outlive the default duration."""
+    test_dir = '.temp_test_cache'
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+    finished = {'10': {'id': 10, 'status': 'FINISHED', 'relations': []}}
+    airing = {'20': {'id': 20, 'status': 'RELEASING', 'relations': []}}
+    with patch('cache.get_cache_dir', return_value=test_dir):
+        with patch('cache.get_cache_duration', return_value=3600):
+            with patch('cache.get_finished_cache_duration', return_value=30 * 86400):
+                cache.save_to_franchise_graph(finished)
+                cache.save_to_franchise_graph(airing)
+
+            backend = cache.FileCacheBackend()
+            assert backend.read(cache.get_cache_key('franchise', '10'))['duration'] == 30 * 86400
+            assert 'duration' not in backend.read(cache.get_cache_key('franchise', '20'))
+
+            cache.get_memory_cache().clear()
+            with patch('time.time', return_value=time.time() + 7200):
+                assert cache.get_franchise_graph(10) == finished
+                assert cache.get_franchise_graph(20) is None
+
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+def test_offline_mode_keeps_expired_entries():
+    """Test that compaction and pruning never drop expired entries offline."""
+    test_dir = '.temp_test_cache'
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+    with patch('cache.get_cache_dir', return_value=test_dir):
+        with patch('cache.get_cache_duration', return_value=3600):
+            key = cache.get_cache_key('search', 'shipped')
+            cache.FileCacheBackend().write(key, {'timestamp': time.time() - 3 * 86400, 'payload': [{'id': 1}]})
+            cache.get_memory_cache().clear()
+
+            with patch('config.load_config', return_value={'anilist_client': {'offline': True}}):
+                assert cache.maybe_compact() is None
+            assert cache.maybe_compact(offline=True) is None
+            assert cache.prune_cache(offline=True) == {'expired': 0, 'evicted': 0}
+            assert cache.get_cached_entry(key) == ([{'id': 1}], True)
+
+            assert cache.prune_cache()['expired'] == 1
+
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+def test_stale_while_revalidate_keeps_expired_entries_for_grace_period():
+    """Test that pruning keeps recently expired entries for stale-while-revalidate."""
+    test_dir = '.temp_test_cache'
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+    conf = {'anilist_cache': {'stale_while_revalidate': True, 'stale_grace': 48, 'eviction_policy': 'lfu'}}
+    with patch('cache.get_cache_dir', return_value=test_dir):
+        with patch('cache.get_cache_duration', return_value=3600):
+            backend = cache.FileCacheBackend()
+            backend.write('search_recent.json', {'timestamp': time.time() - 86400, 'payload': [1]})
+            backend.write('search_old.json', {'timestamp': time.time() - 3 * 86400, 'payload': [2]})
+
+            with patch('config.load_config', return_value=conf):
+                assert cache.prune_cache(backend) == {'expired': 1, 'evicted': 0}
+                assert cache.get_cache_stats(backend)['hits'] is None
+            assert backend.keys() == ['search_recent.json']
+
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+def test_bundle_export_leaves_access_stats_untouched():
+    """Test that exporting a bundle doesn't count as using the entries."""
+    test_dir = '.temp_test_cache'
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+    os.makedirs(test_dir)
+    bundle = os.path.join(test_dir, 'bundle.json.gz')
+
+    with patch('cache.get_cache_duration', return_value=3600):
+        sqlite_backend = cache.SQLiteCacheBackend(os.path.join(test_dir, 'cache.sqlite3'))
+        sqlite_backend.write('search_a.json', {'timestamp': time.time(), 'payload': ['a']})
+        assert cache.export_bundle(bundle, backend=sqlite_backend) == 1
+        assert [entry['hits'] for entry in sqlite_backend.iter_entries()] == [0]
+        sqlite_backend.close()
+
+        file_backend = cache.FileCacheBackend(test_dir)
+        file_backend.write('search_b.json', {'timestamp': time.time(), 'payload': ['b']})
+        path = file_backend.get_path('search_b.json')
+        os.utime(path, (1000, 1000))
+        assert cache.export_bundle(bundle, backend=file_backend) == 1
+        assert os.path.getmtime(path) == 1000
+
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
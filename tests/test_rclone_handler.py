@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pytest
+from unittest.mock import patch, MagicMock
+import rclone_handler
+
+def test_split_remote_path():
+    """
+    Test splitting rclone paths into the fs and remote used by the rc API.
+    """
+    assert rclone_handler.split_remote_path('gdrive:Anime/Show/ep01.mkv') == ('gdrive:Anime/Show', 'ep01.mkv')
+    assert rclone_handler.split_remote_path('gdrive:/ep01.mkv') == ('gdrive:', 'ep01.mkv')
+    assert rclone_handler.split_remote_path('gdrive:ep01.mkv') == ('gdrive:', 'ep01.mkv')
+    assert rclone_handler.split_remote_path('/ep01.mkv') == ('/', 'ep01.mkv')
+
+def test_rcd_operations_use_rc_api():
+    """
+    Test that the rcd transport maps operations onto rc API calls.
+    """
+    rcd = rclone_handler.RcloneRcd()
+    rcd.url = 'http://127.0.0.1:5572/'
+    rcd.session = MagicMock()
+    rcd.session.post.return_value.ok = True
+    rcd.session.post.return_value.json.return_value = {'list': [{'Path': 'ep01.mkv', 'Name': 'ep01.mkv', 'IsDir': False}]}
+
+    assert rcd.list('gdrive:Anime') == [{'Path': 'ep01.mkv', 'Name': 'ep01.mkv', 'IsDir': False}]
+    rcd.session.post.assert_called_with('http://127.0.0.1:5572/operations/list', json={'fs': 'gdrive:Anime', 'remote': '', 'opt': {}}, timeout=rcd.timeout)
+
+    assert rcd.movefile('gdrive:Anime/a.mkv', 'gdrive:Anime/Show/b.mkv')
+    rcd.session.post.assert_called_with(
+        'http://127.0.0.1:5572/operations/movefile',
+        json={'srcFs': 'gdrive:Anime', 'srcRemote': 'a.mkv', 'dstFs': 'gdrive:Anime/Show', 'dstRemote': 'b.mkv'},
+        timeout=rcd.timeout,
+    )
+
+    rcd.session.post.return_value.ok = False
+    rcd.session.post.return_value.json.return_value = {'error': 'object not found'}
+    assert not rcd.deletefile('gdrive:Anime/missing.mkv')
+
+    rcd.session.post.return_value.status_code = 404
+    rcd.session.post.return_value.json.return_value = {'error': 'directory not found'}
+    assert rcd.list('gdrive:Anime/S00_OVAs') == []
+
+@patch('rclone_handler.subprocess.run')
+def test_rc_transport_falls_back_to_subprocess(mock_run):
+    """
+    Test that a failed rc call falls back to the rclone command line.
+    """
+    rcd = MagicMock()
+    rcd.list.return_value = None
+    rcd.movefile.return_value = True
+    mock_run.return_value.stdout = 'ep01.mkv\n'
+
+    with patch('rclone_handler._rcd', rcd):
+        assert rclone_handler.rclone_moveto('gdrive:a.mkv', 'gdrive:b.mkv')
+        mock_run.assert_not_called()
+
+        assert rclone_handler.rclone_lsf('gdrive:Anime') == ['ep01.mkv']
+        mock_run.assert_called_once()
+
+@patch('rclone_handler.rclone_delete', return_value=True)
+@patch('rclone_handler.rclone_copyto')
+@patch('rclone_handler.rclone_moveto')
+def test_rclone_move_falls_back_to_copy_and_delete(mock_moveto, mock_copyto, mock_delete):
+    """
+    Test that a failed moveto falls back to copy and delete.
+    """
+    mock_moveto.side_effect = lambda source, dest, config: source == 'gdrive:a.mkv'
+    mock_copyto.side_effect = lambda source, dest, config: source != 'gdrive:c.mkv'
+
+    assert rclone_handler.rclone_move('gdrive:a.mkv', 'gdrive:A.mkv', 'rclone.conf')
+    assert rclone_handler.rclone_move('gdrive:b.mkv', 'gdrive:B.mkv', 'rclone.conf')
+    assert not rclone_handler.rclone_move('gdrive:c.mkv', 'gdrive:C.mkv', 'rclone.conf')
+    mock_delete.assert_called_once_with('gdrive:b.mkv', 'rclone.conf')
+
+@patch('rclone_handler.rclone_lsf', return_value=['ep01.mkv', 'Extras/'])
+def test_remote_namespace_tracks_listing_and_moves(mock_rclone_lsf):
+    """
+    Test that the namespace is filled from lsjson entries and lists unknown directories once.
+    """
+    namespace = rclone_handler.RemoteNamespace('gdrive', 'rclone.conf')
+    for entry in [{'Path': 'Show', 'IsDir': True}, {'Path': 'Show/ep01.mkv', 'IsDir': False}]:
+        namespace.record(entry, recursive=True)
+
+    assert namespace.names('gdrive:Show') == {'ep01.mkv'}
+    namespace.add('Show/ep02.mkv')
+    namespace.discard('gdrive:Show/ep01.mkv')
+    assert namespace.names('Show') == {'ep02.mkv'}
+    mock_rclone_lsf.assert_not_called()
+
+    assert namespace.names('Other') == {'ep01.mkv', 'Extras'}
+    assert namespace.names('Other') == {'ep01.mkv', 'Extras'}
+    mock_rclone_lsf.assert_called_once_with('gdrive:Other', 'rclone.conf')
+
+@patch('rclone_handler.subprocess.Popen')
+def test_iter_lsjson_streams_entries(mock_popen):
+    """
+    Test that lsjson output is parsed line by line with recursion and filters.
+    """
+    import io
+
+    process = mock_popen.return_value
+    process.stdout = io.StringIO('[\n{"Path":"Show/ep01.mkv","IsDir":false},\n{"Path":"Show/ep01.ass","IsDir":false}\n]\n')
+    process.wait.return_value = 0
+
+    entries = rclone_handler.iter_lsjson('gdrive:Anime', 'rclone.conf', recursive=True, include=['*.mkv', '*.ass'])
+    assert next(entries) == {'Path': 'Show/ep01.mkv', 'IsDir': False}
+    mock_popen.assert_called_once()
+    assert list(entries) == [{'Path': 'Show/ep01.ass', 'IsDir': False}]
+    process.kill.assert_not_called()
+
+    cmd = mock_popen.call_args[0][0]
+    assert cmd == ['rclone', 'lsjson', 'gdrive:Anime', '--files-only', '-R', '--fast-list',
+                   '--include', '*.mkv', '--include', '*.ass', '--ignore-case', '--config', 'rclone.conf']
+
+    process.stdout = io.StringIO('[\n{"Path":"ep01.mkv"},\n{"Path":"ep02.mkv"}\n]\n')
+    entries = rclone_handler.iter_lsjson('gdrive:Anime')
+    next(entries)
+    entries.close()
+    process.kill.assert_called_once()
+
+    # A listing that rclone couldn't finish is reported after the partial entries
+    process.stdout = io.StringIO('[\n{"Path":"ep01.mkv"},\n')
+    process.wait.return_value = 3
+    entries = rclone_handler.iter_lsjson('gdrive:Anime')
+    assert next(entries) == {'Path': 'ep01.mkv'}
+    with pytest.raises(rclone_handler.RcloneError):
+        next(entries)
+
+def test_operation_pool_limits_each_remote():
+    """
+    Test that the pool caps concurrency per remote and aggregates the results.
+    """
+    import threading
+    import time
+
+    active = {}
+    peak = {}
+    lock = threading.Lock()
+
+    def fake_move(source, dest, config):
+        remote = rclone_handler.get_remote_name(source)
+        with lock:
+            active[remote] = active.get(remote, 0) + 1
+            peak[remote] = max(peak.get(remote, 0), active[remote])
+        time.sleep(0.02)
+        with lock:
+            active[remote] -= 1
+        return not dest.endswith('fail.mkv')
+
+    with patch('rclone_handler.rclone_move', side_effect=fake_move):
+        with rclone_handler.RcloneOperationPool('rclone.conf', limits={'gdrive': 1}, default_limit=4) as pool:
+            futures = [pool.move(f"gdrive:{i}.mkv", f"gdrive:Show/{i}.mkv") for i in range(4)]
+            futures += [pool.move(f"s3:{i}.mkv", f"s3:Show/{i}.mkv") for i in range(7)]
+            futures.append(pool.move('s3:x.mkv', 's3:fail.mkv'))
+            result = pool.wait()
+
+    assert all(future.done() for future in futures)
+    assert peak['gdrive'] == 1
+    assert 1 < peak['s3'] <= 4
+    assert result == {'total': 12, 'succeeded': 11, 'failed': [('move', ('s3:x.mkv', 's3:fail.mkv'))]}
+    assert pool.wait() == {'total': 0, 'succeeded': 0, 'failed': []}  # Counted operations are dropped
+
+@patch('rclone_handler.rclone_lsf')
+def test_remote_namespace_does_not_cache_failed_listing(mock_rclone_lsf):
+    """
+    Test that a failed listing is retried instead of being taken as an empty directory.
+    """
+    mock_rclone_lsf.side_effect = [None, ['Show - S01E01.mkv']]
+    namespace = rclone_handler.RemoteNamespace('gdrive')
+
+    assert namespace.names('Show') is None
+    assert namespace.names('Show') == {'Show - S01E01.mkv'}
+    assert mock_rclone_lsf.call_count == 2
+
+@patch('rclone_handler.subprocess.Popen')
+def test_rcd_credentials_are_not_on_the_command_line(mock_popen):
+    """
+    Test that the rc credentials are passed to rclone rcd through the environment.
+    """
+    mock_popen.return_value.poll.return_value = None
+    rcd = rclone_handler.RcloneRcd()
+    rcd.session = MagicMock(auth=('rclone', 'secret'))
+    rcd.session.post.return_value.ok = True
+
+    assert rcd.start()
+    cmd = mock_popen.call_args[0][0]
+    env = mock_popen.call_args[1]['env']
+    assert 'secret' not in cmd and '--rc-pass' not in cmd
+    assert env['RCLONE_RC_USER'] == 'rclone' and env['RCLONE_RC_PASS'] == 'secret'
@@ -96,11 +96,11 @@ def test_find_files_rclone(mock_rclone_handler):
     """
     Test the find_files function with an rclone remote.
     """
-    mock_rclone_handler.rclone_lsjson.return_value = [
+    mock_rclone_handler.iter_lsjson.return_value = iter([
         {'Path': 'My Anime/S01/My Anime - 01.mkv', 'IsDir': False},
         {'Path': 'My Anime/S01/My Anime - 01.ass', 'IsDir': False},
         {'Path': 'My Anime/S01/another_file.txt', 'IsDir': False},
-    ]
+    ])
 
     file_groups = anime_renamer.find_files('gdrive:/Anime', recursive=True, rclone_remote='gdrive:/Anime', rclone_config='rclone.conf')
 
@@ -112,7 +112,7 @@ def test_find_files_rclone(mock_rclone_handler):
     }
 
     assert file_groups == expected_groups
-    mock_rclone_handler.rclone_lsjson.assert_called_once_with('gdrive:/Anime', 'rclone.conf')
+    mock_rclone_handler.iter_lsjson.assert_called_once_with('gdrive:/Anime', 'rclone.conf', recursive=True, include=['*.mkv', '*.mp4', '*.srt', '*.ass'])
 
 @patch('builtins.input', side_effect=['1', '/path/to/anime'])
 @patch('anime_renamer.find_files')
@@ -124,3 +124,159 @@ def test_interactive_menu_local(mock_isdir, mock_find_files, mock_input):
     with patch('sys.argv', ['anime_renamer.py']):
         anime_renamer.main()
     mock_find_files.assert_called_with('/path/to/anime', False)
+
+def test_match_anime():
+    """
+    Test automatic matching of AniList search results.
+    """
+    conf = {'fuzzy_threshold': 85}
+    only = {'id': 1, 'title': {'romaji': 'My Anime'}}
+    other = {'id': 2, 'title': {'romaji': 'Something Else Entirely'}}
+
+    assert anime_renamer.match_anime('My Anime', [], conf) == (None, None)
+    assert anime_renamer.match_anime('Whatever', [only], conf) == (only, None)
+
+    selected, score = anime_renamer.match_anime('My Anime', [only, other], conf)
+    assert selected == only and score >= 85
+
+    selected, score = anime_renamer.match_anime('Unrelated', [only, other], conf)
+    assert selected is None
+
+@patch('anime_renamer.anilist_api')
+@patch('anime_renamer.anilist_aio.AsyncAniListClient')
+@patch('anime_renamer.scan_directory')
+def test_prewarm_cache(mock_scan_directory, mock_client_class, mock_anilist_api):
+    """
+    Test that prewarming resolves season chains without renaming anything.
+    """
+    from unittest.mock import AsyncMock
+
+    mock_scan_directory.return_value = [('/a', {}, 'My Anime'), ('/b', {}, 'Ambiguous')]
+    client = mock_client_class.return_value
+    client.search_anime_batch = AsyncMock(return_value={
+        'My Anime': [{'id': 1, 'title': {'romaji': 'My Anime'}}],
+        'Ambiguous': [{'id': 2, 'title': {'romaji': 'First'}}, {'id': 3, 'title': {'romaji': 'Second'}}],
+    })
+    client.get_many_season_data = AsyncMock()
+    args = MagicMock(force_refresh=False)
+
+    with patch('anime_renamer.process_folder') as mock_process_folder:
+        anime_renamer.prewarm_cache(['/library'], args, {'fuzzy_threshold': 85})
+
+    client.get_many_season_data.assert_awaited_once_with([1, 2, 3], False)
+    mock_process_folder.assert_not_called()
+
+@patch('rclone_handler.rclone_lsf')
+def test_get_unique_rclone_filepath_uses_namespace(mock_rclone_lsf):
+    """
+    Test that collision checks use the remote namespace instead of listing.
+    """
+    import rclone_handler
+
+    namespace = rclone_handler.RemoteNamespace('gdrive')
+    namespace.record({'Path': 'Show - S01E01.mkv', 'IsDir': False})
+    namespace.add('Show - S01E01_v2.mkv')
+
+    assert anime_renamer.get_unique_rclone_filepath('gdrive', 'Show - S01E01.mkv', None, namespace) == 'Show - S01E01_v3.mkv'
+    assert anime_renamer.get_unique_rclone_filepath('gdrive', 'Show - S01E02.mkv', None, namespace) == 'Show - S01E02.mkv'
+    mock_rclone_lsf.assert_not_called()
+
+@patch('anime_renamer.rclone_handler')
+def test_get_unique_rclone_filepath_failed_listing(mock_rclone_handler):
+    """
+    Test that no destination is picked when the remote directory can't be listed.
+    """
+    mock_rclone_handler.rclone_lsf.return_value = None
+    assert anime_renamer.get_unique_rclone_filepath('gdrive', 'Anime/Show - S01E01.mkv') is None
+
+@patch('anime_renamer.rclone_handler.iter_lsjson')
+def test_find_files_rclone_incomplete_listing(mock_iter_lsjson):
+    """
+    Test that a remote whose listing fails partway is not processed or trusted.
+    """
+    import rclone_handler
+
+    def partial_listing(*args, **kwargs):
+        yield {'Path': 'My Anime/My Anime - 01.mkv', 'IsDir': False}
+        raise rclone_handler.RcloneError("listing failed")
+
+    mock_iter_lsjson.side_effect = partial_listing
+    namespace = rclone_handler.RemoteNamespace('gdrive')
+
+    assert anime_renamer.find_files('gdrive', recursive=True, rclone_remote='gdrive', namespace=namespace) == {}
+    with patch('rclone_handler.rclone_lsf', return_value=['My Anime - 01.mkv', 'My Anime - 02.mkv']) as mock_lsf:
+        assert namespace.names('My Anime') == {'My Anime - 01.mkv', 'My Anime - 02.mkv'}
+        mock_lsf.assert_called_once()
+
+def test_bundle_ova_on_remote_creates_missing_folder():
+    """
+    Test that specials are moved into a not yet existing S00_OVAs folder on a remote.
+    """
+    import concurrent.futures
+    import subprocess
+    import rclone_handler
+
+    def run_move(source_path, dest_path):
+        future = concurrent.futures.Future()
+        future.set_result(True)
+        return future
+
+    conf = {'rename_template': '{title} - S{season:02d}E{episode:02d}', 'title_language': 'romaji'}
+    parsed = {'anime_title': 'Show', 'episode_number': '01', 'anime_type': 'OVA'}
+    dest = 'gdrive:Show/S00_OVAs/Show - S00E01.mkv'
+
+    # The destination folder doesn't exist yet, which rclone lsf reports with exit code 3
+    missing = subprocess.CalledProcessError(rclone_handler.RCLONE_EXIT_DIR_NOT_FOUND, ['rclone', 'lsf'])
+    with patch('anime_renamer.anitopy.parse', return_value=parsed), patch('rclone_handler.subprocess.run', side_effect=missing):
+        pool = MagicMock()
+        pool.move.side_effect = run_move
+        files = {'videos': ['Show/Show - OVA.mkv'], 'subtitles': []}
+        anime_renamer.process_folder('Show', files, None, conf, False, False, False, True, False, False, rclone_remote='gdrive', pool=pool)
+        pool.move.assert_called_once_with('gdrive:Show/Show - OVA.mkv', dest)
+
+    # After a complete recursive scan, unseen folders are known to be empty without listing them
+    namespace = rclone_handler.RemoteNamespace('gdrive')
+    namespace.record({'Path': 'Show/Show - OVA.mkv', 'IsDir': False}, recursive=True)
+    namespace.mark_complete()
+    with patch('anime_renamer.anitopy.parse', return_value=parsed), patch('rclone_handler.rclone_lsf') as mock_lsf:
+        pool = MagicMock()
+        pool.move.side_effect = run_move
+        files = {'videos': ['Show/Show - OVA.mkv'], 'subtitles': []}
+        anime_renamer.process_folder('Show', files, None, conf, False, False, False, True, False, False, rclone_remote='gdrive', namespace=namespace, pool=pool)
+        pool.move.assert_called_once_with('gdrive:Show/Show - OVA.mkv', dest)
+        mock_lsf.assert_not_called()
+
+@patch('anime_renamer.prewarm_cache')
+@patch('anime_renamer.cache')
+def test_prewarm_refused_when_offline_in_config(mock_cache, mock_prewarm_cache):
+    """
+    Test that offline mode set only in the config is honoured like --offline.
+    """
+    mock_cache.is_offline.side_effect = lambda offline=False: True
+    with patch('sys.argv', ['anime_renamer.py', '--prewarm', '/library']), patch('anime_renamer.anilist_api') as mock_anilist_api:
+        with pytest.raises(SystemExit):
+            anime_renamer.main()
+    mock_cache.is_offline.assert_called_once_with(False)
+    mock_anilist_api.set_offline.assert_called_once_with()
+    mock_prewarm_cache.assert_not_called()
+
+def test_get_unique_rclone_filepath_waits_for_pending_moves():
+    """
+    Test that a name held by a queued move is allocated by the move's outcome, not by timing.
+    """
+    import concurrent.futures
+    import threading
+    import rclone_handler
+
+    for moved, expected in ((True, 'Show/a.mkv'), (False, 'Show/a_v2.mkv')):
+        namespace = rclone_handler.RemoteNamespace('gdrive')
+        namespace.record({'Path': 'Show/a.mkv', 'IsDir': False}, recursive=True)
+        namespace.mark_complete()
+        namespace.add('Show/b.mkv')
+
+        future = concurrent.futures.Future()
+        namespace.track_move('gdrive:Show/a.mkv', 'gdrive:Show/b.mkv', future)
+        threading.Timer(0.05, future.set_result, [moved]).start()
+
+        assert anime_renamer.get_unique_rclone_filepath('gdrive', 'Show/a.mkv', None, namespace) == expected
+        assert namespace.names('Show') == ({'b.mkv'} if moved else {'a.mkv'})